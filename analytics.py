@@ -0,0 +1,124 @@
+import sqlite3
+import argparse
+from typing import Dict, List
+
+import numpy as np
+
+# Vectorized popularity metrics: videos, video_stats and character_mentions are loaded once into
+# numpy columns, and every per-character number is a bincount over the mention rows.
+
+BUCKETS = {"day": "datetime64[D]", "week": "datetime64[W]", "month": "datetime64[M]", "year": "datetime64[Y]"}
+
+
+def _column(conn: sqlite3.Connection, query: str, dtypes: List[str]) -> List[np.ndarray]:
+    rows = conn.execute(query).fetchall()
+    if not rows:
+        return [np.empty(0, dtype=d) for d in dtypes]
+    cols = list(zip(*rows))
+    return [np.asarray(col, dtype=d) for col, d in zip(cols, dtypes)]
+
+
+def load_columns(db_path: str = "combined.db") -> Dict[str, np.ndarray]:
+    """Read the three fact tables once into columnar arrays, aligned on dense indices."""
+    conn = sqlite3.connect(db_path)
+    char_ids, names = _column(conn, "SELECT id, name FROM characters WHERE name IS NOT NULL AND name != '' ORDER BY id",
+                              ["int64", "object"])
+    video_ids, published = _column(conn, "SELECT id, COALESCE(published_at, '') FROM videos ORDER BY id",
+                                   ["int64", "U19"])
+    stat_refs, views, likes, comments = _column(
+        conn, "SELECT video_ref, COALESCE(view_count, 0), COALESCE(like_count, 0), COALESCE(comment_count, 0) "
+              "FROM video_stats", ["int64", "int64", "int64", "int64"])
+    m_chars, m_videos = _column(conn, "SELECT character_ref, video_id FROM character_mentions", ["int64", "int64"])
+    conn.close()
+
+    # stats aligned to the videos array (0 for videos without a stats row)
+    n_videos = len(video_ids)
+    video_views = np.zeros(n_videos, dtype=np.int64)
+    video_likes = np.zeros(n_videos, dtype=np.int64)
+    video_comments = np.zeros(n_videos, dtype=np.int64)
+    pos = np.searchsorted(video_ids, stat_refs)
+    ok = pos < n_videos
+    ok[ok] &= video_ids[pos[ok]] == stat_refs[ok]
+    video_views[pos[ok]] = views[ok]
+    video_likes[pos[ok]] = likes[ok]
+    video_comments[pos[ok]] = comments[ok]
+
+    # mention rows as (character index, video index), dropping rows that point at missing ids
+    c_pos = np.searchsorted(char_ids, m_chars)
+    v_pos = np.searchsorted(video_ids, m_videos)
+    keep = (c_pos < len(char_ids)) & (v_pos < n_videos)
+    keep[keep] &= (char_ids[c_pos[keep]] == m_chars[keep]) & (video_ids[v_pos[keep]] == m_videos[keep])
+
+    return {
+        "names": names,
+        "character_ids": char_ids,
+        "video_ids": video_ids,
+        "published": published.astype("datetime64[s]"),
+        "video_views": video_views,
+        "video_likes": video_likes,
+        "video_comments": video_comments,
+        "mention_char": c_pos[keep],
+        "mention_video": v_pos[keep],
+    }
+
+
+def percentile_rank(values: np.ndarray) -> np.ndarray:
+    """Percent of values strictly below each value, plus half of the ties (0..100)."""
+    if len(values) == 0:
+        return np.empty(0, dtype=float)
+    ordered = np.sort(values)
+    below = np.searchsorted(ordered, values, side="left")
+    at_or_below = np.searchsorted(ordered, values, side="right")
+    return (below + 0.5 * (at_or_below - below)) / len(values) * 100.0
+
+
+def character_metrics(cols: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Per character: mentions, views, likes, comments, engagement (likes/views) and view percentile."""
+    n = len(cols["character_ids"])
+    chars = cols["mention_char"]
+    vids = cols["mention_video"]
+    mentions = np.bincount(chars, minlength=n)
+    views = np.bincount(chars, weights=cols["video_views"][vids], minlength=n).astype(np.int64)
+    likes = np.bincount(chars, weights=cols["video_likes"][vids], minlength=n).astype(np.int64)
+    comments = np.bincount(chars, weights=cols["video_comments"][vids], minlength=n).astype(np.int64)
+    engagement = np.divide(likes, views, out=np.zeros(n, dtype=float), where=views > 0)
+    return {
+        "names": cols["names"],
+        "mentions": mentions,
+        "views": views,
+        "likes": likes,
+        "comments": comments,
+        "engagement": engagement,
+        "views_percentile": percentile_rank(views),
+    }
+
+
+def trends(cols: Dict[str, np.ndarray], bucket: str = "month") -> Dict[str, np.ndarray]:
+    """Mentions and views per character per publish-date bucket: 2D arrays shaped (characters, buckets)."""
+    n = len(cols["character_ids"])
+    vids = cols["mention_video"]
+    stamps = cols["published"][vids].astype(BUCKETS[bucket])
+    dated = ~np.isnat(stamps)
+    buckets, bucket_idx = np.unique(stamps[dated], return_inverse=True)
+    flat = cols["mention_char"][dated] * len(buckets) + bucket_idx
+    size = n * len(buckets)
+    mentions = np.bincount(flat, minlength=size).reshape(n, len(buckets))
+    views = np.bincount(flat, weights=cols["video_views"][vids][dated], minlength=size)
+    return {
+        "names": cols["names"],
+        "buckets": buckets,
+        "mentions": mentions,
+        "views": views.astype(np.int64).reshape(n, len(buckets)),
+    }
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser("popularity analytics")
+    p.add_argument("--db", default="combined.db")
+    p.add_argument("--top", type=int, default=10)
+    args = p.parse_args()
+    m = character_metrics(load_columns(args.db))
+    order = np.argsort(-m["views"], kind="stable")[:args.top]
+    for i in order:
+        print(f"{m['names'][i]}: {m['mentions'][i]} mentions, {m['views'][i]} views, "
+              f"engagement {m['engagement'][i]:.4f}, p{m['views_percentile'][i]:.0f}")
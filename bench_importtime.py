@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List
+
+# Import-time regression check for pipeline.py.
+# For every subcommand we start a fresh interpreter with -X importtime, import pipeline plus
+# the module that subcommand's handler imports, and add up the cumulative time of the
+# top-level imports. The median over --runs is compared against a saved baseline.
+#
+#   python bench_importtime.py --save        # record importtime_baseline.json
+#   python bench_importtime.py               # compare, exit 1 on a regression
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(HERE, "importtime_baseline.json")
+
+# subcommand -> modules its handler imports
+SUBCOMMANDS = {
+    "cli": [],
+    "ingest-hp": ["harrypotter_fetch"],
+    "ingest-yt": ["youtube_fetch"],
+    "merge": ["harrypotter_youtube_db"],
+    "mentions": ["harrypotter_youtube_db"],
+    "report": ["reports"],
+    "render": ["visualization"],
+}
+
+# modules that must not be loaded before the subcommand actually needs them
+HEAVY = ("requests", "matplotlib", "numpy")
+ALLOWED_HEAVY = {"ingest-yt": {"requests"}}
+
+
+def measure_once(modules: List[str]):
+    """Return (total microseconds, set of imported top-level packages) for one cold start."""
+    code = "; ".join(f"import {m}" for m in ["pipeline"] + modules)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=HERE, capture_output=True, text=True, check=True)
+    total = 0
+    loaded = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        loaded.add(name.strip().split(".")[0])
+        # top-level entries are the ones without indentation; their cumulative covers the children
+        if name.startswith(" ") and not name.startswith("  "):
+            total += int(cumulative)
+    return total, loaded
+
+
+def measure(runs: int) -> Dict[str, dict]:
+    results = {}
+    for sub, modules in SUBCOMMANDS.items():
+        times = []
+        loaded = set()
+        for _ in range(runs):
+            us, loaded = measure_once(modules)
+            times.append(us)
+        heavy = sorted(m for m in HEAVY if m in loaded and m not in ALLOWED_HEAVY.get(sub, set()))
+        results[sub] = {"median_us": int(statistics.median(times)), "heavy": heavy}
+    return results
+
+
+def main():
+    p = argparse.ArgumentParser("import-time benchmark")
+    p.add_argument("--runs", type=int, default=7)
+    p.add_argument("--baseline", default=BASELINE_FILE)
+    p.add_argument("--save", action="store_true", help="write the measured numbers as the new baseline")
+    p.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    args = p.parse_args()
+
+    results = measure(args.runs)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    failed = False
+    for sub, res in results.items():
+        line = f"{sub:10s} {res['median_us'] / 1000:8.1f} ms"
+        base = baseline.get(sub)
+        if base:
+            ratio = res["median_us"] / max(base["median_us"], 1)
+            line += f"  (baseline {base['median_us'] / 1000:.1f} ms, x{ratio:.2f})"
+            if ratio > 1 + args.tolerance:
+                line += "  REGRESSION"
+                failed = True
+        if res["heavy"]:
+            line += f"  eager imports: {', '.join(res['heavy'])}"
+            failed = True
+        print(line)
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"baseline written to {args.baseline}")
+    elif failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
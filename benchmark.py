@@ -0,0 +1,303 @@
+import os
+import io
+import sys
+import json
+import math
+import time
+import random
+import importlib
+import sqlite3
+import argparse
+import platform
+import tempfile
+import contextlib
+import multiprocessing
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+import bulk_db
+
+# Benchmark harness for the pipeline hot paths.
+#
+# For each scale (number of video titles) a synthetic character set and title corpus is written
+# to throwaway SQLite dbs shaped like hp_db.db / youtube_db.db. The stages then run in pipeline
+# order against a fresh combined db. Every stage runs in its own child process, so its peak RSS
+# is its own and not left over from the stage before.
+#
+#   python benchmark.py --scales 1000,10000,100000 --out bench.json
+#   python benchmark.py --scales 1000,10000 --compare bench.json
+
+SCALES_DEFAULT = "1000,10000,100000"
+CHARS_DEFAULT = 150
+MENTION_RATE = 0.3
+SYLLABLES = ["ha", "rry", "her", "mi", "one", "ron", "dra", "co", "sev", "er", "us", "lu", "na", "gin",
+             "ny", "nev", "ille", "al", "bus", "min", "er", "va", "sir", "ius", "bel", "la", "trix", "vol",
+             "de", "mort", "ced", "ric", "fleur", "vik", "tor", "dob", "by", "hag", "rid", "lup", "in"]
+
+# stage name -> what its throughput is counted in
+STAGES = [
+    ("import_hp_placeholder", "characters"),
+    ("import_youtube_rows", "titles"),
+    ("import_youtube_set", "titles"),
+    ("build_char_mentions", "titles"),
+    ("calc_character_popularity", "titles"),
+    ("calc_character_appearances_in_yt_videotitle", "titles"),
+    ("visualization_queries", "titles"),
+]
+
+
+# -------------------- synthetic data --------------------
+
+def _word(rng: random.Random, parts: int) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(parts))
+
+
+def synthetic_characters(n: int, seed: int = 0) -> List[tuple]:
+    """n unique (name, alt_names) pairs; about a third of them get one or two alternate names."""
+    rng = random.Random(seed)
+    seen = set()
+    chars = []
+    while len(chars) < n:
+        name = f"{_word(rng, 2).title()} {_word(rng, 3).title()}"
+        if name in seen:
+            continue
+        seen.add(name)
+        alts = [_word(rng, 3).title() for _ in range(rng.choice((0, 0, 1, 2)))]
+        chars.append((name, alts))
+    return chars
+
+
+def synthetic_titles(n: int, chars: List[tuple], seed: int = 0) -> Iterator[str]:
+    rng = random.Random(seed + 1)
+    vocab = [_word(rng, rng.randint(1, 3)) for _ in range(2000)]
+    for _ in range(n):
+        words = rng.sample(vocab, rng.randint(4, 10))
+        if rng.random() < MENTION_RATE:
+            name, alts = rng.choice(chars)
+            words.insert(rng.randrange(len(words) + 1), rng.choice([name] + alts))
+        yield " ".join(words).capitalize()
+
+
+def generate(workdir: str, n_titles: int, n_chars: int = CHARS_DEFAULT, seed: int = 0) -> Dict[str, str]:
+    """Write hp.db and youtube.db under workdir; returns their paths plus where the combined dbs go."""
+    from harrypotter_fetch import init_db as init_hp_db
+    from youtube_fetch import init_db as init_yt_db
+
+    paths = {"hp": os.path.join(workdir, "hp.db"),
+             "youtube": os.path.join(workdir, "youtube.db"),
+             "combined": os.path.join(workdir, "combined.db"),
+             # the set-mode import runs into its own db so both modes copy every title
+             "combined_set": os.path.join(workdir, "combined_set.db")}
+    chars = synthetic_characters(n_chars, seed)
+
+    conn = sqlite3.connect(paths["hp"])
+    init_hp_db(conn)
+    bulk_db.insert_many(conn, "characters", ("name", "house", "role", "alternate_names"),
+                        ((name, "Gryffindor", "student", json.dumps(alts)) for name, alts in chars))
+    conn.commit()
+    conn.close()
+
+    conn = sqlite3.connect(paths["youtube"])
+    # throwaway db: no journal, no fsync
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    init_yt_db(conn)
+    n_channels = n_titles // 1000 + 1
+    bulk_db.insert_many(conn, "channels", ("channel_id", "title", "subscriber_count"),
+                        ((f"UCbench{i:06d}", f"Channel {i}", 1000 * (i + 1)) for i in range(n_channels)))
+    rng = random.Random(seed + 2)
+    start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+
+    def video_rows():
+        for i, title in enumerate(synthetic_titles(n_titles, chars, seed)):
+            views = rng.randint(100, 2_000_000)
+            likes = rng.randint(0, views // 10)
+            published = start + timedelta(seconds=rng.randint(0, 10 * 365 * 86400))
+            yield (f"v{i:010d}", i % n_channels + 1, title, rng.randint(30, 3600), views, likes,
+                   views / likes if likes else None, rng.randint(0, 5000), published.strftime("%Y-%m-%dT%H:%M:%SZ"))
+
+    for batch in bulk_db.chunked(video_rows(), 10_000):
+        bulk_db.insert_many(conn, "videos",
+                            ("video_id", "channel_ref", "title", "duration_seconds", "view_count", "like_count",
+                             "view_like_ratio", "comment_count", "published_at"), batch)
+    conn.commit()
+    conn.close()
+    return paths
+
+
+# -------------------- stages --------------------
+
+def _peak_rss_mb() -> float:
+    # VmHWM on Linux (can be reset, see _reset_peak_rss), ru_maxrss elsewhere
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _reset_peak_rss():
+    # drop the peak left behind by interpreter start-up and unpickling, so the peak is the stage's own
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _call_stage(stage: str, paths: Dict[str, str]):
+    import harrypotter_youtube_db as hyd
+    if stage == "import_hp_placeholder":
+        hyd.import_hp_placeholder(paths["hp"], paths["combined"], None)
+    elif stage == "import_youtube_rows":
+        hyd.import_youtube_from_source(paths["youtube"], paths["combined"], None, mode="rows")
+    elif stage == "import_youtube_set":
+        hyd.import_youtube_from_source(paths["youtube"], paths["combined_set"], None, mode="set")
+    elif stage == "build_char_mentions":
+        hyd.build_char_mentions(paths["combined"])
+    elif stage == "calc_character_popularity":
+        hyd.calc_character_popularity(paths["combined"])
+    elif stage == "calc_character_appearances_in_yt_videotitle":
+        hyd.calc_character_appearances_in_yt_videotitle(paths["combined"])
+    elif stage == "visualization_queries":
+        import visualization
+        stats = hyd.calc_character_popularity(paths["combined"])
+        for data_fn, _, _ in visualization.CHARTS.values():
+            data_fn(stats)
+    else:
+        raise ValueError(f"unknown stage {stage}")
+
+
+def run_stage(stage: str, paths: Dict[str, str]) -> Dict[str, float]:
+    """Runs inside a fresh child process: returns seconds, peak RSS and the RSS the stage added."""
+    # module import cost is not part of the stage
+    importlib.import_module("harrypotter_youtube_db")
+    _reset_peak_rss()
+    before = _peak_rss_mb()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        _call_stage(stage, paths)
+    seconds = time.perf_counter() - started
+    peak = _peak_rss_mb()
+    return {"seconds": seconds, "peak_rss_mb": round(peak, 1), "rss_added_mb": round(peak - before, 1)}
+
+
+def bench_scale(n_titles: int, n_chars: int, seed: int, keep: Optional[str] = None) -> Dict[str, dict]:
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory(prefix="hpbench-") as tmp:
+        workdir = keep or tmp
+        os.makedirs(workdir, exist_ok=True)
+        started = time.perf_counter()
+        paths = generate(workdir, n_titles, n_chars, seed)
+        results = {"generate": {"seconds": time.perf_counter() - started}}
+        for stage, unit in STAGES:
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                res = pool.submit(run_stage, stage, paths).result()
+            items = n_chars if unit == "characters" else n_titles
+            res["throughput"] = round(items / res["seconds"], 1) if res["seconds"] > 0 else None
+            res["throughput_unit"] = f"{unit}/s"
+            res["seconds"] = round(res["seconds"], 4)
+            results[stage] = res
+        results["generate"]["seconds"] = round(results["generate"]["seconds"], 4)
+    return results
+
+
+# -------------------- report --------------------
+
+def scaling_exponent(points: List[tuple]) -> Optional[float]:
+    """Least-squares slope of log(seconds) against log(n): ~1 is linear, ~2 quadratic."""
+    pts = [(math.log(n), math.log(s)) for n, s in points if n > 0 and s > 0]
+    if len(pts) < 2:
+        return None
+    mx = sum(x for x, _ in pts) / len(pts)
+    my = sum(y for _, y in pts) / len(pts)
+    var = sum((x - mx) ** 2 for x, _ in pts)
+    if var == 0:
+        return None
+    return round(sum((x - mx) * (y - my) for x, y in pts) / var, 3)
+
+
+def scaling_curves(results: Dict[str, dict]) -> Dict[str, dict]:
+    curves = {}
+    for stage, _ in STAGES:
+        points = [(int(n), res[stage]["seconds"]) for n, res in results.items()]
+        points.sort()
+        curves[stage] = {"points": points, "exponent": scaling_exponent(points)}
+    return curves
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> bool:
+    """Print per-stage ratios against a previous run; True if any stage got slower than tolerance."""
+    regressed = False
+    for n, stages in current["results"].items():
+        base_stages = baseline.get("results", {}).get(n)
+        if not base_stages:
+            print(f"{n} titles: no baseline")
+            continue
+        for stage, _ in STAGES:
+            old = base_stages.get(stage, {}).get("seconds")
+            new = stages[stage]["seconds"]
+            if not old:
+                continue
+            ratio = new / old
+            flag = ""
+            if ratio > 1 + tolerance:
+                flag = "  REGRESSION"
+                regressed = True
+            print(f"{n:>10} {stage:45s} {old:9.4f}s -> {new:9.4f}s  x{ratio:.2f}{flag}")
+    return regressed
+
+
+def main(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser("pipeline benchmark")
+    p.add_argument("--scales", default=SCALES_DEFAULT, help="comma separated title counts (1000 .. 10000000)")
+    p.add_argument("--chars", type=int, default=CHARS_DEFAULT, help="number of synthetic characters")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", default=None, help="write the JSON report here (default: stdout)")
+    p.add_argument("--compare", default=None, help="previous JSON report to compare against")
+    p.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before --compare fails")
+    p.add_argument("--keep", default=None, help="keep the generated dbs under this directory")
+    args = p.parse_args(argv)
+
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    results = {}
+    for n in scales:
+        print(f"benchmarking {n} titles ...", file=sys.stderr)
+        keep = os.path.join(args.keep, str(n)) if args.keep else None
+        results[str(n)] = bench_scale(n, args.chars, args.seed, keep)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "chars": args.chars,
+            "seed": args.seed,
+            "created": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        },
+        "results": results,
+        "scaling": scaling_curves(results),
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import sqlite3
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+import instrumentation
+
+# shared write helpers for the ingest scripts (harrypotter_fetch, youtube_fetch, harrypotter_youtube_db)
+
+BATCH_SIZE = 500
+
+
+def apply_pragmas(conn: sqlite3.Connection):
+    # WAL + synchronous=NORMAL: commits append to the log instead of an fsync per transaction
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+
+
+def connect(db_file: str, pragmas: bool = True, **kwargs) -> sqlite3.Connection:
+    """pragmas=False for connections that only read (source dbs, report queries)."""
+    conn = sqlite3.connect(db_file, **kwargs)
+    if pragmas:
+        apply_pragmas(conn)
+    instrumentation.trace_connection(conn)
+    return conn
+
+
+def chunked(rows: Iterable, size: int = BATCH_SIZE) -> Iterator[List]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert_sql(table: str, columns: Sequence[str], conflict: Optional[Sequence[str]] = None,
+               update: Optional[Sequence[str]] = None) -> str:
+    """INSERT statement with ON CONFLICT(conflict) DO NOTHING, or DO UPDATE SET col = excluded.col for `update`."""
+    sql = f"INSERT INTO {table}({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+    if conflict:
+        target = ", ".join(conflict)
+        if update:
+            sets = ", ".join(f"{col} = excluded.{col}" for col in update)
+            sql += f" ON CONFLICT({target}) DO UPDATE SET {sets}"
+        else:
+            sql += f" ON CONFLICT({target}) DO NOTHING"
+    return sql
+
+
+def insert_many(conn: sqlite3.Connection, table: str, columns: Sequence[str], rows: Iterable[Sequence],
+                conflict: Optional[Sequence[str]] = None, update: Optional[Sequence[str]] = None) -> int:
+    """executemany one batch of rows; returns how many rows were inserted (or updated).
+    Does not commit — callers commit once per batch."""
+    cur = conn.executemany(insert_sql(table, columns, conflict, update), rows)
+    written = max(cur.rowcount, 0)
+    instrumentation.count(rows_written=written)
+    return written
+
+
+def upsert_returning_id(conn: sqlite3.Connection, table: str, columns: Sequence[str], values: Sequence,
+                        conflict: Sequence[str], update: Sequence[str]) -> int:
+    """Insert-or-update a single row and get its id back in the same statement."""
+    sql = insert_sql(table, columns, conflict, update) + " RETURNING id"
+    return conn.execute(sql, values).fetchone()[0]
@@ -1,13 +1,19 @@
 import os 
-import re 
-import sqlite3
-import requests 
-import argparse 
+import time 
 import json 
 
+import bulk_db
+import http_cache
+import instrumentation
+import json_stream
+
 db_default = "hp_data.db" 
 max_default = 25 
 hp_api_url = "https://hp-api.onrender.com/api/characters"
+hp_cache_ttl = 24 * 3600 #the character list barely changes, one download a day is plenty
+#the only character fields gather_store_hp reads, everything else is dropped while the list is parsed
+hp_fields = {k: None for k in ("name", "house", "species", "patronus", "gender", "hogwartsStudent",
+                               "hogwartsStaff", "yearOfBirth", "alternate_names")}
 
 #first function that does the tables in database for harry potter, conn is the connection to sq database, table 1 is the one that stores hp characters and all the columns about them (name, age, house, etc) table 2 will be for JOINS that will work with youtube data but reference first table integer key 
 def init_db(conn): 
@@ -33,46 +39,87 @@ def init_db(conn):
 """)
     conn.commit() 
 
+def _fetch_hp(headers, stream=False): 
+    import requests #only the fetch path needs it, keeps plain sqlite commands fast to start
+    started = time.perf_counter() 
+    response = requests.get(hp_api_url, headers=headers, stream=stream)
+    nbytes = int(response.headers.get("Content-Length") or 0) if stream else len(response.content)
+    instrumentation.record_http(hp_api_url, response.status_code, nbytes, time.perf_counter() - started)
+    response.raise_for_status() #lifeline stopping the program bc this is probably full of errors DO NOT TOUCH
+    return response 
+
+#streams the character list one character at a time (only `fields` kept) instead of building the whole list
+def iter_hp_chars(fields=hp_fields): 
+    cache = http_cache.default_cache()
+    if cache is None: 
+        response = _fetch_hp({}, stream=True) #no cache: parse straight off the socket
+    else: 
+        #served from http_cache.db when fresh, otherwise revalidated with the ETag so unchanged lists are not re-downloaded
+        #get_stream spools the list through a temp file in chunks instead of holding the whole body in memory
+        response = cache.get_stream(hp_api_url, None, lambda headers: _fetch_hp(headers, stream=True), hp_cache_ttl)
+    yield from json_stream.iter_response(response, None, fields)
+
 #second function gets characters from api, gets full list of characters and turns them into python list 
 def get_hp_char(): 
-    response = requests.get(hp_api_url)
-    response.raise_for_status() #lifeline stopping the program bc this is probably full of errors DO NOT TOUCH
-    return response.json() 
+    return list(iter_hp_chars(None)) 
 #third function that stores 25 runs (characters in our case! I hope you're reading this Emily I feel like this is a niche way of communicating)--> basically this stuff gathers the characters and stores max 25 into database whenever run, figuring out this function was actually so difficult lol 
 def gather_store_hp(db_file, max_per_run = 25): 
-    if max_per_run < 1 or max_per_run > 25:
+    #max_per_run=None is the --all mode: every new character, written in batches
+    if max_per_run is not None and (max_per_run < 1 or max_per_run > 25):
         max_per_run = 25 
-    conn = sqlite3.connect(db_file)
+    conn = bulk_db.connect(db_file)
     init_db(conn)
     cur = conn.cursor() 
-    all_chars = get_hp_char() 
+    all_chars = iter_hp_chars() 
+    #one query for every name we already have instead of a SELECT per character
+    cur.execute("SELECT name FROM characters")
+    seen = {row[0] for row in cur.fetchall()}
+    scanned = [0]
+    def new_rows():
+        taken = 0
+        for char in all_chars: 
+            scanned[0] += 1
+            if max_per_run is not None and taken >= max_per_run: 
+                break
+            name = char.get("name", "").strip() 
+            if name == "" or name in seen: 
+                continue 
+            seen.add(name)
+            taken += 1
+            house = char.get("house", "")
+            species = char.get("species", "")
+            patronus = char.get("patronus", "")
+            gender = char.get("gender", "")
+            role = "student" if char.get("hogwartsStudent") else ("staff" if char.get("hogwartsStaff") else "none") 
+            age = char.get("yearOfBirth")
+            alt_names = json.dumps(char.get("alternate_names", []))
+            yield (name, house, species, role, patronus, gender, age, alt_names)
+    #one transaction per batch, ON CONFLICT covers anything another run added meanwhile
     inserted_rows = 0 
-    for char in all_chars: 
-        if inserted_rows >= max_per_run: 
-            break
-        name = char.get("name", "").strip() 
-        if name == "": 
-            continue 
-        cur.execute("SELECT id FROM characters WHERE name = ?", (name,))
-        char_if_alr_present = cur.fetchone()
-        if char_if_alr_present: 
-            continue
-        house = char.get("house", "")
-        species = char.get("species", "")
-        patronus = char.get("patronus", "")
-        gender = char.get("gender", "")
-        role = "student" if char.get("hogwartsStudent") else ("staff" if char.get("hogwartsStaff") else "none") 
-        age = char.get("yearOfBirth")
-        alt_names = json.dumps(char.get("alternate_names", []))
-        cur.execute(""" INSERT INTO characters(
-                    name, house, species, role, patronus, gender, age, alternate_names) VALUES(?,?,?,?,?,?,?,?)""", 
-                    (name, house, species, role, patronus, gender, age, alt_names))
-        inserted_rows += 1 
+    for batch in bulk_db.chunked(new_rows()):
+        inserted_rows += bulk_db.insert_many(conn, "characters",
+                                             ("name", "house", "species", "role", "patronus", "gender", "age", "alternate_names"),
+                                             batch, conflict=("name",))
         conn.commit() 
+    instrumentation.count(rows_read=scanned[0])
     conn.close() 
     print(f"Added {inserted_rows} new characters to the database.")
-    print("Run the file again to add 25 more until you reach 100.")
+    if max_per_run is not None:
+        print("Run the file again to add 25 more until you reach 100.")
+
+def main(argv=None): 
+    import argparse 
+    p = argparse.ArgumentParser("harry potter fetch")
+    p.add_argument("--db", default="hp_db.db")
+    p.add_argument("--all", action="store_true", help="store every new character instead of 25")
+    instrumentation.add_arguments(p)
+    http_cache.add_arguments(p)
+    args = p.parse_args(argv)
+    instrumentation.configure_from_args(args)
+    http_cache.configure_from_args(args)
+    with instrumentation.stage("ingest_hp"): 
+        gather_store_hp(args.db, None if args.all else 25)
 
 if __name__ == "__main__":
-    gather_store_hp("hp_db.db", 25)
+    main()
 
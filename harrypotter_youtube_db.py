@@ -1,7 +1,17 @@
 
+import os
+import uuid
+import heapq
+import queue
 import sqlite3
-import argparse
-from typing import List, Dict, Optional
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Iterator, Tuple
+
+import bulk_db
+import instrumentation
+from mention_matcher import AliasIndex, MentionMatcher, resolve_aliases
 
 # ------------------ Helper DB functions ------------------
 
@@ -63,8 +73,278 @@ def create_final_schema(conn: sqlite3.Connection):
         FOREIGN KEY(video_id) REFERENCES videos(id)
     )
     """)
+    # watermarks for incremental mention indexing: highest videos.id / characters.id already matched
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS mention_index_state (
+        source TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    # --all imports: last source videos.id copied from each source db, so an interrupted run resumes
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS import_checkpoints (
+        source TEXT PRIMARY KEY,
+        last_src_id INTEGER NOT NULL DEFAULT 0
+    )
+    """)
     
     conn.commit()
+    migrate_final_schema(conn)
+
+# ------------------ Schema migrations ------------------
+# The schema version lives in PRAGMA user_version. Each migration runs once, in order,
+# inside its own transaction together with the version bump.
+
+def _migrate_indexes(cur: sqlite3.Cursor):
+    # duplicate character names: point their mentions at the first row with that name, then drop the copies
+    cur.execute("""
+        UPDATE character_mentions
+        SET character_ref = (
+            SELECT MIN(c2.id) FROM characters c1 JOIN characters c2 ON c2.name = c1.name
+            WHERE c1.id = character_mentions.character_ref
+        )
+        WHERE character_ref IN (
+            SELECT c.id FROM characters c
+            WHERE c.id > (SELECT MIN(id) FROM characters WHERE name = c.name)
+        )
+    """)
+    cur.execute("DELETE FROM characters WHERE id > (SELECT MIN(id) FROM characters c2 WHERE c2.name = characters.name)")
+    # duplicate (character, video) mention rows, keep the first
+    cur.execute("""
+        DELETE FROM character_mentions
+        WHERE id NOT IN (SELECT MIN(id) FROM character_mentions GROUP BY character_ref, video_id)
+    """)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_mentions_char_video ON character_mentions(character_ref, video_id)")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_characters_name ON characters(name)")
+    # video -> characters direction of the chart joins, and channel lookups
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_mentions_video_char ON character_mentions(video_id, character_ref)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_videos_channel ON videos(channel_ref)")
+
+def fts5_available(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+def _migrate_title_fts(cur: sqlite3.Cursor):
+    # FTS5 index over videos.title (external content, kept in sync by triggers). Builds without
+    # FTS5 skip it and the title searches fall back to scanning.
+    if not fts5_available(cur.connection):
+        return
+    cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5(
+            title, content='videos', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS videos_fts_ai AFTER INSERT ON videos BEGIN
+            INSERT INTO videos_fts(rowid, title) VALUES (new.id, new.title);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS videos_fts_ad AFTER DELETE ON videos BEGIN
+            INSERT INTO videos_fts(videos_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS videos_fts_au AFTER UPDATE OF title ON videos BEGIN
+            INSERT INTO videos_fts(videos_fts, rowid, title) VALUES ('delete', old.id, old.title);
+            INSERT INTO videos_fts(rowid, title) VALUES (new.id, new.title);
+        END
+    """)
+    cur.execute("INSERT INTO videos_fts(videos_fts) VALUES ('rebuild')")
+
+POPULARITY_AGGREGATE = """
+    SELECT c.id,
+           COUNT(cm.video_id),
+           COALESCE(SUM(vs.view_count), 0),
+           COALESCE(SUM(vs.like_count), 0),
+           COALESCE(SUM(vs.comment_count), 0)
+    FROM characters c
+    LEFT JOIN character_mentions cm ON cm.character_ref = c.id
+    LEFT JOIN video_stats vs ON vs.video_ref = cm.video_id
+    GROUP BY c.id
+"""
+
+def _popularity_delta_sql(sign: str, row: str) -> str:
+    # add (sign '+') or remove (sign '-') one mention row's contribution
+    stat = f"(SELECT {{col}} FROM video_stats WHERE video_ref = {row}.video_id)"
+    return f"""
+        INSERT OR IGNORE INTO character_popularity(character_ref) VALUES ({row}.character_ref);
+        UPDATE character_popularity SET
+            mentions = mentions {sign} 1,
+            total_views = total_views {sign} COALESCE({stat.format(col='view_count')}, 0),
+            total_likes = total_likes {sign} COALESCE({stat.format(col='like_count')}, 0),
+            total_comments = total_comments {sign} COALESCE({stat.format(col='comment_count')}, 0)
+        WHERE character_ref = {row}.character_ref;
+    """
+
+def _stats_delta_sql(views: str, likes: str, comments: str, video_ref: str) -> str:
+    # push a video_stats change to every character mentioned in that video
+    return f"""
+        UPDATE character_popularity SET
+            total_views = total_views + ({views}),
+            total_likes = total_likes + ({likes}),
+            total_comments = total_comments + ({comments})
+        WHERE character_ref IN (SELECT character_ref FROM character_mentions WHERE video_id = {video_ref});
+    """
+
+def _migrate_character_popularity(cur: sqlite3.Cursor):
+    # per-character summary every report/chart reads; triggers keep it current as
+    # character_mentions and video_stats change
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS character_popularity (
+            character_ref INTEGER PRIMARY KEY,
+            mentions INTEGER NOT NULL DEFAULT 0,
+            total_views INTEGER NOT NULL DEFAULT 0,
+            total_likes INTEGER NOT NULL DEFAULT 0,
+            total_comments INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(character_ref) REFERENCES characters(id)
+        )
+    """)
+    cur.execute("INSERT OR REPLACE INTO character_popularity " + POPULARITY_AGGREGATE)
+    triggers = {
+        "popularity_char_ai": ("AFTER INSERT ON characters",
+                               "INSERT OR IGNORE INTO character_popularity(character_ref) VALUES (new.id);"),
+        "popularity_char_ad": ("AFTER DELETE ON characters",
+                               "DELETE FROM character_popularity WHERE character_ref = old.id;"),
+        "popularity_mention_ai": ("AFTER INSERT ON character_mentions", _popularity_delta_sql("+", "new")),
+        "popularity_mention_ad": ("AFTER DELETE ON character_mentions", _popularity_delta_sql("-", "old")),
+        "popularity_mention_au": ("AFTER UPDATE OF character_ref, video_id ON character_mentions",
+                                  _popularity_delta_sql("-", "old") + _popularity_delta_sql("+", "new")),
+        "popularity_stats_ai": ("AFTER INSERT ON video_stats",
+                                _stats_delta_sql("COALESCE(new.view_count, 0)", "COALESCE(new.like_count, 0)",
+                                                 "COALESCE(new.comment_count, 0)", "new.video_ref")),
+        "popularity_stats_ad": ("AFTER DELETE ON video_stats",
+                                _stats_delta_sql("-COALESCE(old.view_count, 0)", "-COALESCE(old.like_count, 0)",
+                                                 "-COALESCE(old.comment_count, 0)", "old.video_ref")),
+        "popularity_stats_au": ("AFTER UPDATE ON video_stats",
+                                _stats_delta_sql("-COALESCE(old.view_count, 0)", "-COALESCE(old.like_count, 0)",
+                                                 "-COALESCE(old.comment_count, 0)", "old.video_ref")
+                                + _stats_delta_sql("COALESCE(new.view_count, 0)", "COALESCE(new.like_count, 0)",
+                                                   "COALESCE(new.comment_count, 0)", "new.video_ref")),
+    }
+    for name, (event, body) in triggers.items():
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+def _migrate_stats_polled_at(cur: sqlite3.Cursor):
+    # when the stats were polled at the source, so merging several shards can keep the newest
+    have = {row[1] for row in cur.execute("PRAGMA table_info(video_stats)")}
+    if "stats_polled_at" not in have:
+        cur.execute("ALTER TABLE video_stats ADD COLUMN stats_polled_at TEXT")
+
+def _history_ts_sql(polled_at: str) -> str:
+    # unix seconds of the poll, or of now when the source did not say
+    return f"CAST(COALESCE(strftime('%s', {polled_at}), strftime('%s', 'now')) AS INTEGER)"
+
+def _history_delta_sql(ts: str, views: str, likes: str, comments: str, video_ref: str) -> str:
+    # two changes of one video in the same second end up in one row
+    return f"""
+        INSERT INTO video_stats_history(video_ref, ts, d_views, d_likes, d_comments)
+        VALUES ({video_ref}, {ts}, {views}, {likes}, {comments})
+        ON CONFLICT(video_ref, ts) DO UPDATE SET
+            d_views = d_views + excluded.d_views,
+            d_likes = d_likes + excluded.d_likes,
+            d_comments = d_comments + excluded.d_comments;
+    """
+
+def _migrate_stats_history(cur: sqlite3.Cursor):
+    # append-only history of video_stats. Each row is the change since the previous row of the
+    # same video (the first row is the change from zero), so a video's counts at time t are the
+    # sums of its deltas with ts <= t. Deltas are small integers and only changes are written,
+    # which keeps rows at a few bytes each; WITHOUT ROWID stores them in (video_ref, ts) order
+    # with no separate rowid b-tree.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS video_stats_history (
+            video_ref INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            d_views INTEGER NOT NULL DEFAULT 0,
+            d_likes INTEGER NOT NULL DEFAULT 0,
+            d_comments INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(video_ref, ts)
+        ) WITHOUT ROWID
+    """)
+    # the stats we already have become each video's first snapshot
+    cur.execute(f"""
+        INSERT INTO video_stats_history(video_ref, ts, d_views, d_likes, d_comments)
+        SELECT video_ref, {_history_ts_sql('stats_polled_at')},
+               COALESCE(view_count, 0), COALESCE(like_count, 0), COALESCE(comment_count, 0)
+        FROM video_stats WHERE true
+        ON CONFLICT(video_ref, ts) DO NOTHING
+    """)
+    triggers = {
+        "stats_history_ai": ("AFTER INSERT ON video_stats",
+                             _history_delta_sql(_history_ts_sql("new.stats_polled_at"), "COALESCE(new.view_count, 0)",
+                                                "COALESCE(new.like_count, 0)", "COALESCE(new.comment_count, 0)",
+                                                "new.video_ref")),
+        "stats_history_au": ("AFTER UPDATE OF view_count, like_count, comment_count ON video_stats "
+                             "WHEN new.view_count IS NOT old.view_count OR new.like_count IS NOT old.like_count "
+                             "OR new.comment_count IS NOT old.comment_count",
+                             _history_delta_sql(_history_ts_sql("new.stats_polled_at"),
+                                                "COALESCE(new.view_count, 0) - COALESCE(old.view_count, 0)",
+                                                "COALESCE(new.like_count, 0) - COALESCE(old.like_count, 0)",
+                                                "COALESCE(new.comment_count, 0) - COALESCE(old.comment_count, 0)",
+                                                "new.video_ref")),
+        "stats_history_ad": ("AFTER DELETE ON video_stats",
+                             _history_delta_sql(_history_ts_sql("NULL"), "-COALESCE(old.view_count, 0)",
+                                                "-COALESCE(old.like_count, 0)", "-COALESCE(old.comment_count, 0)",
+                                                "old.video_ref")),
+    }
+    for name, (event, body) in triggers.items():
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+def _migrate_character_aliases(cur: sqlite3.Cursor):
+    # every name and alternate name, normalized, pointing at the one character it resolves to
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS character_aliases (
+            alias_norm TEXT PRIMARY KEY,
+            character_ref INTEGER NOT NULL,
+            alias TEXT NOT NULL,
+            is_primary INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(character_ref) REFERENCES characters(id)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_character_aliases_character ON character_aliases(character_ref)")
+    # one row: a random token replaced on every alias sync, which keys the in-memory alias index
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS character_alias_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            token TEXT NOT NULL
+        )
+    """)
+    _sync_aliases(cur)
+    _new_alias_token(cur)
+
+def _migrate_checkpoint_identity(cur: sqlite3.Cursor):
+    # video_id of the source row at last_src_id: a source file replaced by another db at the same
+    # path will not have that video there, and the checkpoint is not trusted
+    have = {row[1] for row in cur.execute("PRAGMA table_info(import_checkpoints)")}
+    if "last_video_id" not in have:
+        cur.execute("ALTER TABLE import_checkpoints ADD COLUMN last_video_id TEXT")
+
+MIGRATIONS = [
+    (1, _migrate_indexes),
+    (2, _migrate_title_fts),
+    (3, _migrate_character_popularity),
+    (4, _migrate_stats_polled_at),
+    (5, _migrate_stats_history),
+    (6, _migrate_character_aliases),
+    (7, _migrate_checkpoint_identity),
+]
+
+def migrate_final_schema(conn: sqlite3.Connection):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target, migrate in MIGRATIONS:
+        if version >= target:
+            continue
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        migrate(conn.cursor())
+        conn.execute(f"PRAGMA user_version = {target}")
+        conn.commit()
+        version = target
 
 def get_final_channel_id(conn: sqlite3.Connection, channel_id: str) -> Optional[int]:
     cur = conn.cursor()
@@ -73,23 +353,39 @@ def get_final_channel_id(conn: sqlite3.Connection, channel_id: str) -> Optional[
     return r[0] if r else None
 
 def upsert_final_channel(conn: sqlite3.Connection, channel_id: str, title: Optional[str], subs: Optional[int]) -> int:
-    cur = conn.cursor()
-    # insert or update
-    cur.execute(
+    # insert or update, id comes back from the same statement; caller commits
+    return bulk_db.upsert_returning_id(conn, "channels", ("channel_id", "title", "subscriber_count"),
+                                       (channel_id, title, subs), ("channel_id",), ("title", "subscriber_count"))
+
+def video_stats_upsert_sql(select_sql: str) -> str:
+    """INSERT into video_stats from `select_sql` (video_ref, views, likes, comments, ratio, polled at).
+    The newest poll wins; a row without a poll time counts as the oldest, and for equal poll times
+    the higher counts win, so every writer agrees on which copy of a video's stats to keep."""
+    return f"""
+        INSERT INTO video_stats(video_ref, view_count, like_count, comment_count, view_like_ratio, stats_polled_at)
+        {select_sql}
+        ON CONFLICT(video_ref) DO UPDATE SET
+            view_count = excluded.view_count,
+            like_count = excluded.like_count,
+            comment_count = excluded.comment_count,
+            view_like_ratio = excluded.view_like_ratio,
+            stats_polled_at = excluded.stats_polled_at
+        WHERE (COALESCE(excluded.stats_polled_at, ''), excluded.view_count, excluded.like_count, excluded.comment_count)
+            > (COALESCE(video_stats.stats_polled_at, ''), COALESCE(video_stats.view_count, 0),
+               COALESCE(video_stats.like_count, 0), COALESCE(video_stats.comment_count, 0))
     """
-    INSERT INTO channels(channel_id, title, subscriber_count)
-    VALUES(?, ?, ?)
-    ON CONFLICT(channel_id) DO UPDATE SET title=excluded.title, subscriber_count=excluded.subscriber_count
-    """,
-    (channel_id, title, subs)
-    )
-    conn.commit()
-    return get_final_channel_id(conn, channel_id)
 
-def fetch_unimported_videos_from_source(src_conn: sqlite3.Connection, final_conn: sqlite3.Connection, limit: int) -> List[Dict]:
-    """Return up to `limit` video rows from source that are not yet in final (by video_id).
+# params: views, likes, comments, view/like ratio, polled at (or None), youtube video id
+VIDEO_STATS_UPSERT = video_stats_upsert_sql("SELECT id, ?, ?, ?, ?, ? FROM videos WHERE video_id = ?")
+
+def fetch_unimported_videos_from_source(src_conn: sqlite3.Connection, final_conn: sqlite3.Connection,
+                                        limit: Optional[int], chunk_size: int = bulk_db.BATCH_SIZE,
+                                        after_id: int = 0) -> Iterator[List[Dict]]:
+    """Yield chunks of video rows from source that are not yet in final (by video_id), in source id
+        order starting after `after_id`; `limit` caps the total (None = everything).
         The function expects the source DB to have tables named `channels` and `videos`
         with a schema similar to the one used in the youtube fetcher (channel_id available).
+        Rows come off the cursor chunk by chunk, so memory stays bounded for any source size.
     """
     src_cur = src_conn.cursor()
     # Attempt to select videos that final doesn't have yet
@@ -100,122 +396,423 @@ def fetch_unimported_videos_from_source(src_conn: sqlite3.Connection, final_conn
             "c.subscriber_count AS source_channel_subs "
             "FROM videos v "
             "JOIN channels c ON v.channel_ref = c.id "
-            "WHERE NOT EXISTS ("
+            "WHERE v.id > ? AND NOT EXISTS ("
             "    SELECT 1 FROM final.videos f WHERE f.video_id = v.video_id"
             ") "
+            "ORDER BY v.id "
             "LIMIT ?"
         )
     # Note: we'll attach final DB as 'main' when opening connections so this subquery works.
-    src_cur.execute(query, (limit,))
+    src_cur.execute(query, (after_id, -1 if limit is None else limit))
     cols = [d[0] for d in src_cur.description]
-    rows = src_cur.fetchall()
-    result = []
-    for r in rows:
-        result.append({cols[i]: r[i] for i in range(len(cols))})
-    return result
-
-def import_youtube_from_source(src_db_path: str, final_db_path: str, limit: int = 25) -> None:
-    """Import up to `limit` new videos from src_db_path into final_db_path."""
-    src_conn = sqlite3.connect(src_db_path)
-    final_conn = sqlite3.connect(final_db_path)
-
-    # Attach final DB inside the source connection so the query can reference final.videos
-    src_conn.execute(f"ATTACH DATABASE '{final_db_path}' AS final")
-
-    create_final_schema(final_conn)
-
-    # Fetch videos that are not already in final
-    videos = fetch_unimported_videos_from_source(src_conn, final_conn, limit)
-    if not videos:
-        print("No new videos to import from source.")
-        src_conn.close()
-        final_conn.close()
-        return
-
-    fcur = final_conn.cursor()
-    inserted = 0
-
+    while True:
+        rows = src_cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield [{cols[i]: r[i] for i in range(len(cols))} for r in rows]
+
+def get_import_checkpoint(conn: sqlite3.Connection, src_conn: sqlite3.Connection, source: str) -> int:
+    """Source videos.id to resume after, or 0 when the source at that path is not the db the
+    checkpoint was written for (its row at last_src_id has a different video_id, or is gone)."""
+    row = conn.execute("SELECT last_src_id, last_video_id FROM import_checkpoints WHERE source = ?",
+                       (source,)).fetchone()
+    if not row or not row[0]:
+        return 0
+    found = src_conn.execute("SELECT video_id FROM videos WHERE id = ?", (row[0],)).fetchone()
+    if row[1] is None or found is None or found[0] != row[1]:
+        print(f"Checkpoint for {source} does not match this source db; starting from the beginning.")
+        conn.execute("DELETE FROM import_checkpoints WHERE source = ?", (source,))
+        conn.commit()
+        return 0
+    return row[0]
+
+def _write_video_batch(final_conn: sqlite3.Connection, videos: List[Dict], checkpoint: Optional[tuple] = None) -> int:
+    """Write one batch of source video rows (channels, videos, stats) in a single transaction.
+    `checkpoint` = (source, last source id, its video_id) is saved in that same transaction.
+    Returns how many videos were new."""
+    channels = {}
+    for v in videos:
+        channels[v.get('source_channel_id')] = (
+            v.get('source_channel_id'), v.get('source_channel_title'), v.get('source_channel_subs')
+        )
+    bulk_db.insert_many(final_conn, "channels", ("channel_id", "title", "subscriber_count"), channels.values(),
+                        conflict=("channel_id",), update=("title", "subscriber_count"))
+    placeholders = ", ".join("?" for _ in channels)
+    channel_ids = dict(final_conn.execute(
+        f"SELECT channel_id, id FROM channels WHERE channel_id IN ({placeholders})", list(channels)
+    ).fetchall())
+
+    video_rows = []
+    stats_rows = []
     for v in videos:
         vid = v.get('video_id')
-        title = v.get('title')
         duration = v.get('duration_seconds') if 'duration_seconds' in v else v.get('duration')
         published = v.get('published_at') if 'published_at' in v else v.get('publishedAt')
+        video_rows.append((vid, channel_ids.get(v.get('source_channel_id')), v.get('title'), duration, published))
+
+        # Stats
+        view_count = v.get('view_count') or v.get('viewCount') or 0
+        like_count = v.get('like_count') or v.get('likeCount') or 0
+        comment_count = v.get('comment_count') or v.get('commentCount') or 0
+        view_like_ratio = (float(view_count) / float(like_count)) if like_count else None
+        stats_rows.append((view_count, like_count, comment_count, view_like_ratio, v.get('stats_polled_at'), vid))
+
+    inserted = bulk_db.insert_many(final_conn, "videos",
+                                   ("video_id", "channel_ref", "title", "duration_seconds", "published_at"),
+                                   video_rows, conflict=("video_id",))
+    stats_cur = final_conn.executemany(VIDEO_STATS_UPSERT, stats_rows)
+    instrumentation.count(rows_written=max(stats_cur.rowcount, 0))
+    if checkpoint is not None:
+        final_conn.execute("""
+            INSERT INTO import_checkpoints(source, last_src_id, last_video_id) VALUES (?, ?, ?)
+            ON CONFLICT(source) DO UPDATE SET
+                last_src_id = excluded.last_src_id,
+                last_video_id = excluded.last_video_id
+        """, checkpoint)
+    final_conn.commit()
+    return inserted
+
+MERGE_MODES = ("rows", "set")
+
+def import_youtube_from_source(src_db_path: str, final_db_path: str, limit: Optional[int] = 25,
+                               chunk_size: int = bulk_db.BATCH_SIZE, mode: str = "rows") -> None:
+    """Import up to `limit` new videos from src_db_path into final_db_path.
+    limit=None streams every new video in chunks and checkpoints after each one.
+    mode="set" does the same transfer with merge_youtube_from_source instead."""
+    if mode == "set":
+        merge_youtube_from_source(src_db_path, final_db_path, limit)
+        return
+    src_conn = bulk_db.connect(src_db_path, pragmas=False)
+    final_conn = bulk_db.connect(final_db_path)
+    create_final_schema(final_conn)
 
-        # channel mapping
-        source_channel_id = v.get('source_channel_id')
-        source_channel_title = v.get('source_channel_title')
-        source_subs = v.get('source_channel_subs')
-
-        final_channel_row_id = get_final_channel_id(final_conn, source_channel_id)
-        if final_channel_row_id is None:
-            final_channel_row_id = upsert_final_channel(
-                final_conn, source_channel_id, source_channel_title, source_subs
-            )
+    # Attach final DB inside the source connection so the query can reference final.videos
+    src_conn.execute(f"ATTACH DATABASE '{final_db_path}' AS final")
 
-        try:
-            fcur.execute(
-                "INSERT INTO videos(video_id, channel_ref, title, duration_seconds, published_at) VALUES (?, ?, ?, ?, ?)",
-                (vid, final_channel_row_id, title, duration, published)
-            )
-            final_vid_id = fcur.lastrowid
-
-            # Stats
-            view_count = v.get('view_count') or v.get('viewCount') or 0
-            like_count = v.get('like_count') or v.get('likeCount') or 0
-            comment_count = v.get('comment_count') or v.get('commentCount') or 0
-            view_like_ratio = (float(view_count) / float(like_count)) if like_count else None
-
-            fcur.execute(
-                "INSERT OR REPLACE INTO video_stats(video_ref, view_count, like_count, comment_count, view_like_ratio) VALUES (?, ?, ?, ?, ?)",
-                (final_vid_id, view_count, like_count, comment_count, view_like_ratio)
-            )
-
-            final_conn.commit()
-            inserted += 1
-
-        except sqlite3.IntegrityError:
-            continue
+    source = os.path.abspath(src_db_path)
+    after_id = get_import_checkpoint(final_conn, src_conn, source) if limit is None else 0
+    if after_id:
+        print(f"Resuming {src_db_path} after source video id {after_id}.")
 
-    print(f"Imported {inserted} videos into {final_db_path} from {src_db_path}.")
+    # Fetch videos that are not already in final
+    inserted = 0
+    seen = 0
+    for videos in fetch_unimported_videos_from_source(src_conn, final_conn, limit, chunk_size, after_id):
+        checkpoint = (source, videos[-1]['id'], videos[-1]['video_id']) if limit is None else None
+        inserted += _write_video_batch(final_conn, videos, checkpoint)
+        seen += len(videos)
+        instrumentation.count(rows_read=len(videos))
+        if limit is None:
+            print(f"  ...{inserted} videos imported so far")
+
+    if not seen:
+        print("No new videos to import from source.")
+    else:
+        print(f"Imported {inserted} videos into {final_db_path} from {src_db_path}.")
     src_conn.close()
     final_conn.close()
 
+def merge_youtube_from_source(src_db_path: str, final_db_path: str, limit: Optional[int] = None) -> int:
+    """Set-based version of import_youtube_from_source: the source is ATTACHed to combined.db and
+    channels, videos and video_stats are each copied by one INSERT ... SELECT, all in one transaction.
+    video_stats.video_ref is resolved by joining on video_id. Source columns are looked up the way
+    rows mode reads them (duration_seconds or duration, view_count or viewCount, ...). Returns videos inserted."""
+    conn = bulk_db.connect(final_db_path)
+    create_final_schema(conn)
+    conn.execute("ATTACH DATABASE ? AS src", (src_db_path,))
+    source = os.path.abspath(src_db_path)
+    src_cols = {row[1] for row in conn.execute("PRAGMA src.table_info(videos)")}
+
+    def col(*names: str) -> str:
+        # the source's column for this value (older fetchers used the API's camelCase names)
+        present = [f"v.{name}" for name in names if name in src_cols]
+        if not present:
+            return "NULL"
+        return present[0] if len(present) == 1 else f"COALESCE({', '.join(present)})"
+
+    duration = col("duration_seconds", "duration")
+    published = col("published_at", "publishedAt")
+    views = col("view_count", "viewCount")
+    likes = col("like_count", "likeCount")
+    comments = col("comment_count", "commentCount")
+    polled = col("stats_polled_at")
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # the source rows to copy: not yet in combined.db (by video_id), source id order, capped by limit
+        conn.execute("DROP TABLE IF EXISTS temp.merge_todo")
+        conn.execute("CREATE TEMP TABLE merge_todo(src_id INTEGER PRIMARY KEY)")
+        todo = conn.execute("""
+            INSERT INTO temp.merge_todo(src_id)
+            SELECT v.id FROM src.videos v
+            JOIN src.channels c ON v.channel_ref = c.id
+            WHERE NOT EXISTS (SELECT 1 FROM main.videos f WHERE f.video_id = v.video_id)
+            ORDER BY v.id
+            LIMIT ?
+        """, (-1 if limit is None else limit,)).rowcount
+
+        conn.execute("""
+            INSERT INTO main.channels(channel_id, title, subscriber_count)
+            SELECT DISTINCT c.channel_id, c.title, c.subscriber_count
+            FROM temp.merge_todo t
+            JOIN src.videos v ON v.id = t.src_id
+            JOIN src.channels c ON c.id = v.channel_ref
+            WHERE c.channel_id IS NOT NULL
+            ON CONFLICT(channel_id) DO UPDATE SET
+                title = excluded.title,
+                subscriber_count = excluded.subscriber_count
+        """)
+        inserted = conn.execute(f"""
+            INSERT INTO main.videos(video_id, channel_ref, title, duration_seconds, published_at)
+            SELECT v.video_id, fc.id, v.title, {duration}, {published}
+            FROM temp.merge_todo t
+            JOIN src.videos v ON v.id = t.src_id
+            JOIN src.channels c ON c.id = v.channel_ref
+            LEFT JOIN main.channels fc ON fc.channel_id = c.channel_id
+            WHERE true
+            ORDER BY t.src_id
+            ON CONFLICT(video_id) DO NOTHING
+        """).rowcount
+        stats = conn.execute(video_stats_upsert_sql(f"""
+            SELECT f.id, COALESCE({views}, 0), COALESCE({likes}, 0), COALESCE({comments}, 0),
+                   CASE WHEN {likes} THEN CAST({views} AS REAL) / {likes} END, {polled}
+            FROM temp.merge_todo t
+            JOIN src.videos v ON v.id = t.src_id
+            JOIN main.videos f ON f.video_id = v.video_id
+            WHERE true
+        """)).rowcount
+        if limit is None and todo:
+            # keep the rows-mode resume point in step with what is now imported
+            conn.execute("""
+                INSERT INTO import_checkpoints(source, last_src_id, last_video_id)
+                SELECT ?, t.src_id, v.video_id
+                FROM temp.merge_todo t JOIN src.videos v ON v.id = t.src_id
+                WHERE true
+                ORDER BY t.src_id DESC LIMIT 1
+                ON CONFLICT(source) DO UPDATE SET
+                    last_src_id = excluded.last_src_id,
+                    last_video_id = excluded.last_video_id
+            """, (source,))
+        conn.execute("DROP TABLE temp.merge_todo")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("DETACH DATABASE src")
+        conn.close()
+    instrumentation.count(rows_read=todo, rows_written=inserted + stats)
+
+    if not todo:
+        print("No new videos to import from source.")
+    else:
+        print(f"Imported {inserted} videos into {final_db_path} from {src_db_path}.")
+    return inserted
+
+
+
+
+# -------------------- several youtube shards --------------------
+
+# row layout sent from the shard readers to the writer
+SHARD_COLUMNS = ("video_id", "polled_at", "view_count", "like_count", "comment_count", "shard",
+                 "title", "duration_seconds", "published_at", "channel_id", "channel_title", "channel_subs")
+SHARD_QUEUE_BATCHES = 8
+# seconds to wait on a reader before checking whether it is still running
+SHARD_QUEUE_TIMEOUT = 30
+
+def _stats_rank(row: tuple) -> tuple:
+    """Which copy of a video wins: newest poll, then the higher counts, then the first shard (by path)."""
+    return (row[1] or "", row[2] or 0, row[3] or 0, row[4] or 0, -row[5])
+
+def _read_shard(path: str, rank: int, final_db_path: str) -> Iterator[tuple]:
+    """Rows of one shard in video_id order, skipping videos combined.db already has with stats at
+    least as new."""
+    conn = sqlite3.connect("file:" + os.path.abspath(path) + "?mode=ro", uri=True)
+    conn.execute("ATTACH DATABASE ? AS final", ("file:" + os.path.abspath(final_db_path) + "?mode=ro",))
+    have = {row[1] for row in conn.execute("PRAGMA table_info(videos)")}
+    polled = "v.stats_polled_at" if "stats_polled_at" in have else "NULL"
+    query = f"""
+        SELECT v.video_id, {polled}, COALESCE(v.view_count, 0), COALESCE(v.like_count, 0),
+               COALESCE(v.comment_count, 0), ?, v.title, v.duration_seconds, v.published_at,
+               c.channel_id, c.title, c.subscriber_count
+        FROM videos v
+        JOIN channels c ON v.channel_ref = c.id
+        LEFT JOIN final.videos f ON f.video_id = v.video_id
+        LEFT JOIN final.video_stats s ON s.video_ref = f.id
+        WHERE v.video_id IS NOT NULL AND (
+            f.id IS NULL OR s.video_ref IS NULL
+            OR (COALESCE({polled}, ''), COALESCE(v.view_count, 0), COALESCE(v.like_count, 0), COALESCE(v.comment_count, 0))
+             > (COALESCE(s.stats_polled_at, ''), COALESCE(s.view_count, 0), COALESCE(s.like_count, 0), COALESCE(s.comment_count, 0))
+        )
+        ORDER BY v.video_id
+    """
+    try:
+        yield from conn.execute(query, (rank,))
+    finally:
+        conn.close()
 
+def _dedupe(rows: Iterator[tuple]) -> Iterator[tuple]:
+    """rows sorted by video_id -> one winner per video_id."""
+    for _, copies in itertools.groupby(rows, key=lambda r: r[0]):
+        yield max(copies, key=_stats_rank)
 
+def _shard_reader(shards: List[tuple], final_db_path: str, q, batch_size: int):
+    """Worker process: merge its shards by video_id, keep the winner of each video, send batches."""
+    try:
+        merged = heapq.merge(*(_read_shard(path, rank, final_db_path) for path, rank in shards),
+                             key=lambda r: r[0])
+        for batch in bulk_db.chunked(_dedupe(merged), batch_size):
+            q.put(batch)
+        q.put(None)
+    except BaseException as e:
+        q.put(("error", repr(e)))
+        raise
+
+def _drain(q, proc: multiprocessing.Process) -> Iterator[tuple]:
+    """Rows from one reader's queue. A reader that dies without sending its end marker (killed,
+    out of memory) raises here instead of leaving the merge waiting forever."""
+    while True:
+        try:
+            batch = q.get(timeout=SHARD_QUEUE_TIMEOUT)
+        except queue.Empty:
+            if proc.exitcode is None:
+                continue
+            # it has exited: anything it sent before that is already in the pipe
+            try:
+                batch = q.get(timeout=SHARD_QUEUE_TIMEOUT)
+            except queue.Empty:
+                raise RuntimeError(f"shard reader {proc.name} exited with code {proc.exitcode} "
+                                   f"before finishing") from None
+        if batch is None:
+            return
+        if isinstance(batch, tuple):
+            raise RuntimeError(f"shard reader failed: {batch[1]}")
+        yield from batch
+
+def _write_shard_batch(final_conn: sqlite3.Connection, rows: List[tuple]) -> Tuple[int, int]:
+    """One transaction: channels, new videos, and stats that are newer than what combined.db has.
+    Returns (videos inserted, stats rows written)."""
+    channels = {}
+    for r in rows:
+        if r[9] is not None:
+            channels[r[9]] = (r[9], r[10], r[11])
+    bulk_db.insert_many(final_conn, "channels", ("channel_id", "title", "subscriber_count"), channels.values(),
+                        conflict=("channel_id",), update=("title", "subscriber_count"))
+    inserted = max(final_conn.executemany("""
+        INSERT INTO videos(video_id, channel_ref, title, duration_seconds, published_at)
+        SELECT ?, (SELECT id FROM channels WHERE channel_id = ?), ?, ?, ?
+        WHERE true
+        ON CONFLICT(video_id) DO NOTHING
+    """, [(r[0], r[9], r[6], r[7], r[8]) for r in rows]).rowcount, 0)
+    stats = final_conn.executemany(VIDEO_STATS_UPSERT, [(r[2], r[3], r[4], (float(r[2]) / r[3]) if r[3] else None, r[1], r[0])
+                                                        for r in rows])
+    final_conn.commit()
+    updated = max(stats.rowcount, 0)
+    instrumentation.count(rows_written=inserted + updated)
+    return inserted, updated
+
+def merge_youtube_shards(src_db_paths: List[str], final_db_path: str, workers: Optional[int] = None,
+                         batch_size: int = bulk_db.BATCH_SIZE) -> int:
+    """Merge several youtube_db shards into combined.db.
+
+    Up to `workers` reader processes each take a slice of the shards, open them read-only and stream
+    their rows in video_id order (already merged and deduplicated within the slice). This process is
+    the only writer: it merges the readers' streams, keeps one copy per video_id (newest
+    stats_polled_at, then higher counts, then the first shard by path) and commits in batches.
+    The result does not depend on worker count or timing. Returns how many videos were new."""
+    conn = bulk_db.connect(final_db_path)
+    create_final_schema(conn)
+    # shard rank by path, so argument order does not change which copy wins a tie
+    shards = [(path, rank) for rank, path in enumerate(sorted({os.path.abspath(p) for p in src_db_paths}))]
+    n = max(1, min(workers or os.cpu_count() or 1, len(shards)))
+    queues = [multiprocessing.Queue(SHARD_QUEUE_BATCHES) for _ in range(n)]
+    readers = [multiprocessing.Process(target=_shard_reader, args=(shards[i::n], final_db_path, q, batch_size),
+                                       daemon=True)
+               for i, q in enumerate(queues)]
+    for proc in readers:
+        proc.start()
 
-def import_hp_placeholder(hp_db_path: str, final_db_path: str, limit: int = 25): 
-    """Placeholder for importing HP data from partner DB."""
+    inserted = 0
+    updated = 0
+    read = 0
+    try:
+        merged = heapq.merge(*(_drain(q, proc) for q, proc in zip(queues, readers)), key=lambda r: r[0])
+        for batch in bulk_db.chunked(_dedupe(merged), batch_size):
+            read += len(batch)
+            new, stats = _write_shard_batch(conn, batch)
+            inserted += new
+            updated += stats
+    finally:
+        for proc in readers:
+            if proc.is_alive():
+                proc.terminate()
+            proc.join()
+        conn.close()
+    instrumentation.count(rows_read=read)
+    print(f"Merged {len(shards)} shards into {final_db_path}: {inserted} new videos, {updated} stats rows written.")
+    return inserted
+
+def check_merge_options(sources: List[str], import_all: bool, merge_mode: Optional[str]):
+    """Several shards always go through merge_youtube_shards, which copies everything and keeps no
+    checkpoint, so --limit and --merge-mode cannot apply to them: say so instead of ignoring them."""
+    if len(sources) < 2:
+        return
+    if not import_all:
+        raise SystemExit("several --youtube-src shards are always merged in full: pass --all "
+                         "(--limit only applies to a single source)")
+    if merge_mode is not None:
+        raise SystemExit("--merge-mode only applies to a single --youtube-src")
+
+def import_hp_placeholder(hp_db_path: str, final_db_path: str, limit: Optional[int] = 25): 
+    """Placeholder for importing HP data from partner DB. limit=None copies every character."""
     #gets data from fetch harry potter!! so it copies 25 characters from the database into the final joined database. CHAT WE ARE MERGING!!!!
-    hp_conn = sqlite3.connect(hp_db_path)
-    final_conn = sqlite3.connect(final_db_path)
+    hp_conn = bulk_db.connect(hp_db_path, pragmas=False)
+    final_conn = bulk_db.connect(final_db_path)
     hp_cur = hp_conn.cursor() 
     final_cur = final_conn.cursor() 
     create_final_schema(final_conn)
-    try:
-        hp_cur.execute("SELECT name, house, species, role, patronus, gender, age, alt_names FROM characters")
-    except sqlite3.OperationalError:
-        hp_cur.execute("SELECT name, house, species, role, patronus, gender, age, NULL as alt_names FROM characters")
-
-    all_hp_rows = hp_cur.fetchall() 
+    #harrypotter_fetch calls the column alternate_names, older copies call it alt_names
+    hp_cols = {row[1] for row in hp_cur.execute("PRAGMA table_info(characters)")}
+    alt_col = next((c for c in ("alternate_names", "alt_names") if c in hp_cols), "NULL")
+    hp_cur.execute(f"SELECT name, house, species, role, patronus, gender, age, {alt_col} AS alt_names FROM characters")
+
+    #grab every name already in final once, instead of a SELECT per character
+    final_cur.execute("SELECT name, alt_names FROM characters")
+    existing = {}
+    for name, alt_names in final_cur.fetchall():
+        existing[name] = alt_names
+    backfill = []
+
+    scanned = [0]
+    def new_rows():
+        taken = 0
+        for row in hp_cur: 
+            scanned[0] += 1
+            if limit is not None and taken >= limit: 
+                break 
+            name = row[0] 
+            if name in existing: #continues to not include duplicate names hehehe
+                if existing[name] is None and row[7] is not None:
+                    #imported before alt names were copied, fill them in now
+                    backfill.append((row[7], name))
+                continue 
+            existing[name] = row[7]
+            taken += 1
+            yield tuple(row)
+
+    #one executemany + one commit per batch, the UNIQUE name index keeps it safe if someone else inserted the name
     counter = 0 
-    for row in all_hp_rows: 
-        if counter >= limit: 
-            break 
-        name = row[0] 
-        final_cur.execute("SELECT id FROM characters WHERE name = ?", (name,))
-        existing = final_cur.fetchone() #starts checking for duplicate names 
-        if existing: #creates if scenario if the name is already present 
-            continue #continues to not include duplicate names hehehe
-        house = row[1]
-        species = row[2]
-        role = row[3]
-        patronus = row[4]
-        gender = row[5] 
-        age = row[6]
-        alt_names = row[7]
-        final_cur.execute("""INSERT INTO characters(name, house, species, role, patronus, gender, age, alt_names)VALUES(?,?,?,?,?,?,?,?)""", (name, house, species, role, patronus, gender, age, alt_names,)) 
+    for batch in bulk_db.chunked(new_rows()):
+        counter += bulk_db.insert_many(final_conn, "characters",
+                                       ("name", "house", "species", "role", "patronus", "gender", "age", "alt_names"),
+                                       batch, conflict=("name",))
         final_conn.commit() 
-        counter += 1 
+    if backfill:
+        final_cur.executemany("UPDATE characters SET alt_names = ? WHERE name = ? AND alt_names IS NULL", backfill)
+        instrumentation.count(rows_written=len(backfill))
+    sync_character_aliases(final_conn)
+    instrumentation.count(rows_read=scanned[0])
     hp_conn.close()
     final_conn.close() 
     #safety printing confirmation, currently manifesting this stuff works please omg 
@@ -227,93 +824,386 @@ def import_hp_placeholder(hp_db_path: str, final_db_path: str, limit: int = 25):
 
     pass
 
-def build_char_mentions(final_db_path: str):
-    conn = sqlite3.connect(final_db_path)
+def get_mention_watermarks(conn: sqlite3.Connection) -> tuple[int, int]:
+    """Return (last indexed videos.id, last indexed characters.id), 0 when never indexed."""
+    marks = dict(conn.execute("SELECT source, last_id FROM mention_index_state").fetchall())
+    return marks.get("videos", 0), marks.get("characters", 0)
+
+def save_mention_watermarks(conn: sqlite3.Connection, video_mark: int, char_mark: int):
+    conn.executemany("""
+        INSERT INTO mention_index_state(source, last_id) VALUES (?, ?)
+        ON CONFLICT(source) DO UPDATE SET last_id = excluded.last_id
+    """, [("videos", video_mark), ("characters", char_mark)])
+
+# -------------------- character aliases --------------------
+
+# db file -> (alias token, AliasIndex); the token is a fresh uuid whenever the table changes,
+# so a db recreated at the same path never matches an index cached for the old file
+_alias_cache: Dict[str, Tuple[str, AliasIndex]] = {}
+
+def _alias_token(conn) -> Optional[str]:
+    row = conn.execute("SELECT token FROM character_alias_meta WHERE id = 1").fetchone()
+    return row[0] if row else None
+
+def _new_alias_token(conn):
+    conn.execute("""
+        INSERT INTO character_alias_meta(id, token) VALUES (1, ?)
+        ON CONFLICT(id) DO UPDATE SET token = excluded.token
+    """, (uuid.uuid4().hex,))
+
+def _sync_aliases(conn) -> bool:
+    """Rewrite character_aliases from characters.name/alt_names; True if anything changed.
+    Works on a connection or a cursor and does not commit."""
+    rows = conn.execute("SELECT id, name, alt_names FROM characters ORDER BY id").fetchall()
+    new = resolve_aliases(rows)
+    old = {key: (char_id, alias, bool(primary)) for key, char_id, alias, primary in
+           conn.execute("SELECT alias_norm, character_ref, alias, is_primary FROM character_aliases").fetchall()}
+    if new == old:
+        return False
+    # characters whose aliases changed; if they were already matched, their old videos need a rescan
+    touched = {entry[0] for key in old.keys() | new.keys() if old.get(key) != new.get(key)
+               for entry in (old.get(key), new.get(key)) if entry}
+    video_mark, char_mark = get_mention_watermarks(conn)
+    if any(char_id <= char_mark for char_id in touched):
+        save_mention_watermarks(conn, 0, 0)
+    conn.execute("DELETE FROM character_aliases")
+    bulk_db.insert_many(conn, "character_aliases", ("alias_norm", "character_ref", "alias", "is_primary"),
+                        sorted((key, char_id, alias, int(primary)) for key, (char_id, alias, primary) in new.items()))
+    _new_alias_token(conn)
+    return True
+
+def sync_character_aliases(conn: sqlite3.Connection) -> bool:
+    """Bring character_aliases in line with the characters table (after characters are imported)."""
+    changed = _sync_aliases(conn)
+    conn.commit()
+    return changed
+
+def load_alias_index(conn: sqlite3.Connection) -> AliasIndex:
+    """The alias index of this db, read from character_aliases once and reused until the table changes."""
+    path = conn.execute("PRAGMA database_list").fetchone()[2] or ":memory:"
+    token = _alias_token(conn)
+    cached = _alias_cache.get(path)
+    if cached is not None and token is not None and cached[0] == token:
+        return cached[1]
+    index = AliasIndex({key: (char_id, alias, bool(primary)) for key, char_id, alias, primary in
+                        conn.execute("SELECT alias_norm, character_ref, alias, is_primary FROM character_aliases")})
+    if token is not None and path != ":memory:":
+        _alias_cache[path] = (token, index)
+    return index
+
+def _scan_titles(conn: sqlite3.Connection, matcher: MentionMatcher, query: str, params: tuple, found: dict) -> int:
+    """Scan the titles `query` returns into found[(character id, video id)]; returns how many titles were read."""
+    if not matcher:
+        return 0
+    scanned = 0
+    for video_id, title in conn.execute(query, params):
+        scanned += 1
+        for char_id, count in matcher.scan(title).items():
+            found[(char_id, video_id)] = count
+    return scanned
+
+# per worker process: read-only connection + the compiled matchers, set up once by _init_scan_worker
+_scan_worker = {}
+
+def _init_scan_worker(db_uri: str, patterns: Dict[str, list]):
+    _scan_worker["conn"] = sqlite3.connect(db_uri, uri=True)
+    _scan_worker["matchers"] = {key: MentionMatcher(p) for key, p in patterns.items()}
+
+def _scan_shard(job: Tuple[str, int, int]) -> Tuple[List[tuple], int]:
+    """Scan titles with lo < videos.id <= hi using matcher `key`; returns sorted (char, video, count) rows."""
+    key, lo, hi = job
+    found = {}
+    scanned = _scan_titles(_scan_worker["conn"], _scan_worker["matchers"][key],
+                           "SELECT id, title FROM videos WHERE id > ? AND id <= ?", (lo, hi), found)
+    return sorted((c, v, n) for (c, v), n in found.items()), scanned
+
+def video_id_shards(lo: int, hi: int, n: int) -> List[Tuple[int, int]]:
+    """Split the id range (lo, hi] into at most n contiguous (lo, hi] pieces."""
+    if hi <= lo:
+        return []
+    n = max(1, min(n, hi - lo))
+    step, extra = divmod(hi - lo, n)
+    shards = []
+    start = lo
+    for i in range(n):
+        end = start + step + (1 if i < extra else 0)
+        shards.append((start, end))
+        start = end
+    return shards
+
+def _scan_parallel(final_db_path: str, patterns: Dict[str, list], ranges: List[Tuple[str, int, int]],
+                   workers: int, found: dict) -> int:
+    """Fan the (matcher key, lo, hi) ranges out over worker processes, each reading its own id shards
+    through a read-only connection. Results come back in shard order, so `found` is the same for any
+    worker count."""
+    # a few shards per worker so one slow range does not leave the other cores idle
+    jobs = [(key, a, b) for key, lo, hi in ranges for a, b in video_id_shards(lo, hi, workers * 4)]
+    if not jobs:
+        return 0
+    db_uri = "file:" + os.path.abspath(final_db_path) + "?mode=ro"
+    scanned = 0
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=_init_scan_worker,
+                             initargs=(db_uri, patterns)) as pool:
+        for rows, n in pool.map(_scan_shard, jobs):
+            scanned += n
+            for c, v, count in rows:
+                found[(c, v)] = count
+    return scanned
+
+def build_char_mentions(final_db_path: str, full: bool = False, workers: int = 1):
+    """Match character names against video titles and store the hits in character_mentions.
+    Only videos/characters added since the last run are matched (new videos against every
+    character, new characters against the already indexed videos). full=True re-matches everything.
+    workers > 1 splits the titles into videos.id ranges scanned by that many processes.
+    """
+    conn = bulk_db.connect(final_db_path)
+    create_final_schema(conn)
     cur = conn.cursor()
-    # Load characters + videos
-    cur.execute("SELECT id, name FROM characters")
-    characters = cur.fetchall()
-    cur.execute("SELECT id, title FROM videos")
-    videos = cur.fetchall()
+    # characters written by anything other than import_hp_placeholder still get their aliases
+    sync_character_aliases(conn)
+
+    video_mark, char_mark = (0, 0) if full else get_mention_watermarks(conn)
+    max_video = cur.execute("SELECT COALESCE(MAX(id), 0) FROM videos").fetchone()[0]
+    max_char = cur.execute("SELECT COALESCE(MAX(id), 0) FROM characters").fetchone()[0]
+    if video_mark >= max_video and char_mark >= max_char:
+        conn.close()
+        print("✓ character_mentions already up to date")
+        return
 
-    added = 0
+    # Compile every resolved alias into one automaton (and one for just the new characters)
+    index = load_alias_index(conn)
+    patterns = {"all": index.patterns(), "new": index.patterns(char_mark)}
 
-    for char_id, name in characters:
-        if not name:
-            continue
-        name_lower = name.lower()
-        for video_id, title in videos:
-            if not title:
-                continue
-            if name_lower in title.lower():
-                # Avoid duplicates
-                cur.execute("""
-                    SELECT id FROM character_mentions
-                    WHERE character_ref = ? AND video_id = ?
-                """, (char_id, video_id))
-                if cur.fetchone():
-                    continue
-                cur.execute("""
-                    INSERT INTO character_mentions(character_ref, video_id, mention_count)
-                    VALUES (?, ?, 1)
-                """, (char_id, video_id))
-                added += 1
+    # Existing rows inside the part of the (character x video) grid we are about to rescan
+    cur.execute("""
+        SELECT character_ref, video_id, mention_count FROM character_mentions
+        WHERE (video_id > ? AND video_id <= ?) OR (character_ref > ? AND video_id <= ?)
+    """, (video_mark, max_video, char_mark, video_mark))
+    existing = {(char_id, video_id): count for char_id, video_id, count in cur.fetchall()}
+
+    # One pass over the titles, each title scanned once for all characters
+    # new videos against every character, already indexed videos against the new characters
+    ranges = [("all", video_mark, max_video)]
+    if char_mark < max_char:
+        ranges.append(("new", 0, video_mark))
+    found = {}
+    if workers > 1:
+        scanned = _scan_parallel(final_db_path, patterns, ranges, workers, found)
+    else:
+        scanned = 0
+        for key, lo, hi in ranges:
+            matcher = index.matcher if key == "all" else MentionMatcher(patterns[key])
+            scanned += _scan_titles(conn, matcher,
+                                    "SELECT id, title FROM videos WHERE id > ? AND id <= ?", (lo, hi), found)
+    instrumentation.count(rows_read=scanned)
+
+    # sorted so the rows land in the same order whatever the worker count
+    new_rows = sorted((c, v, n) for (c, v), n in found.items() if (c, v) not in existing)
+    changed = sorted((c, v, n) for (c, v), n in found.items() if (c, v) in existing and existing[(c, v)] != n)
+    stale = sorted(key for key in existing if key not in found)
+
+    # one upsert for new and recounted rows, resolved on the (character_ref, video_id) unique index
+    bulk_db.insert_many(conn, "character_mentions", ("character_ref", "video_id", "mention_count"),
+                        new_rows + changed, conflict=("character_ref", "video_id"), update=("mention_count",))
+    cur.executemany("""
+        DELETE FROM character_mentions WHERE character_ref = ? AND video_id = ?
+    """, stale)
+    instrumentation.count(rows_written=len(stale))
+    save_mention_watermarks(conn, max_video, max_char)
 
     conn.commit()
     conn.close()
 
-    print(f"✓ character_mentions table updated ({added} new rows)")
+    print(f"✓ character_mentions table updated ({len(new_rows)} new rows, "
+          f"{len(changed)} recounted, {len(stale)} removed)")
 
 
 
 # ------------- calculations for both (placeholder start) ------------------
 
+def mentions_up_to_date(conn: sqlite3.Connection) -> bool:
+    """True when character_mentions covers every video and character currently in the db."""
+    video_mark, char_mark = get_mention_watermarks(conn)
+    max_video, max_char = conn.execute(
+        "SELECT (SELECT COALESCE(MAX(id), 0) FROM videos), (SELECT COALESCE(MAX(id), 0) FROM characters)"
+    ).fetchone()
+    return video_mark >= max_video and char_mark >= max_char
+
+def refresh_character_popularity(conn: sqlite3.Connection):
+    """Rebuild character_popularity from scratch (the triggers normally keep it current)."""
+    conn.execute("DELETE FROM character_popularity")
+    conn.execute("INSERT INTO character_popularity " + POPULARITY_AGGREGATE)
+    conn.commit()
+
+def read_character_popularity(conn: sqlite3.Connection) -> List[tuple]:
+    """(name, mentions, views, likes, comments) per named character, in character id order."""
+    return conn.execute("""
+        SELECT c.name, p.mentions, p.total_views, p.total_likes, p.total_comments
+        FROM character_popularity p
+        JOIN characters c ON c.id = p.character_ref
+        WHERE c.name IS NOT NULL AND c.name != ''
+        ORDER BY p.character_ref
+    """).fetchall()
+
+# -------------------- stats history --------------------
+
+# downsampling: rows older than `age` seconds are folded into one row per `bucket` seconds
+HISTORY_TIERS = [
+    (2 * 86400, 3600),       # hourly after two days
+    (30 * 86400, 86400),     # daily after a month
+]
+# rows older than this are folded into one row per video (its counts at that point)
+HISTORY_RETENTION = 365 * 86400
+HISTORY_BUCKETS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+
+def _fold_history(conn: sqlite3.Connection, before: int, ts_expr: str, group: str) -> int:
+    """Replace the history rows older than `before` with their per-(video_ref, group) sums."""
+    conn.execute("DROP TABLE IF EXISTS temp.history_fold")
+    conn.execute(f"""
+        CREATE TEMP TABLE history_fold AS
+        SELECT video_ref, {ts_expr} AS ts, SUM(d_views) AS d_views, SUM(d_likes) AS d_likes,
+               SUM(d_comments) AS d_comments
+        FROM video_stats_history
+        WHERE ts < ?
+        GROUP BY video_ref, {group}
+    """, (before,))
+    removed = conn.execute("DELETE FROM video_stats_history WHERE ts < ?", (before,)).rowcount
+    conn.execute("""
+        INSERT INTO video_stats_history(video_ref, ts, d_views, d_likes, d_comments)
+        SELECT video_ref, ts, d_views, d_likes, d_comments FROM temp.history_fold WHERE true
+        ON CONFLICT(video_ref, ts) DO UPDATE SET
+            d_views = d_views + excluded.d_views,
+            d_likes = d_likes + excluded.d_likes,
+            d_comments = d_comments + excluded.d_comments
+    """)
+    kept = conn.execute("SELECT COUNT(*) FROM temp.history_fold").fetchone()[0]
+    conn.execute("DROP TABLE temp.history_fold")
+    return removed - kept
+
+def compact_stats_history(conn: sqlite3.Connection, now: Optional[int] = None,
+                          tiers: List[Tuple[int, int]] = HISTORY_TIERS,
+                          retention: Optional[int] = HISTORY_RETENTION) -> int:
+    """Apply the downsampling tiers and the retention window; returns how many rows went away.
+    A folded row sits at the last timestamp of its bucket, so the counts as of that time (and the
+    latest counts) stay exact; only the points inside a bucket are lost."""
+    import time
+    now = int(time.time()) if now is None else now
+    removed = 0
+    with conn:
+        for age, bucket in tiers:
+            removed += _fold_history(conn, now - age, "MAX(ts)", f"ts / {int(bucket)}")
+        if retention is not None:
+            removed += _fold_history(conn, now - retention, "MAX(ts)", "video_ref")
+    instrumentation.count(rows_written=removed)
+    return removed
+
+def character_popularity_series(conn: sqlite3.Connection, since: str, until: str, bucket: int = 86400,
+                                character: Optional[str] = None) -> List[tuple]:
+    """(name, bucket start (UTC), views, likes, comments gained) per character and time bucket
+    for since <= t < until (ISO-8601 times). A video's first snapshot counts as gaining all of its
+    counts. Each mentioned video is a primary key range seek on video_stats_history."""
+    bucket = int(bucket)
+    query = f"""
+        SELECT c.name, strftime('%Y-%m-%dT%H:%M:%SZ', (h.ts / {bucket}) * {bucket}, 'unixepoch') AS bucket,
+               SUM(h.d_views), SUM(h.d_likes), SUM(h.d_comments)
+        FROM character_mentions cm
+        JOIN characters c ON c.id = cm.character_ref
+        JOIN video_stats_history h ON h.video_ref = cm.video_id
+            AND h.ts >= CAST(strftime('%s', ?) AS INTEGER) AND h.ts < CAST(strftime('%s', ?) AS INTEGER)
+        WHERE c.name IS NOT NULL AND c.name != '' {"AND c.name = ?" if character else ""}
+        GROUP BY c.id, h.ts / {bucket}
+        ORDER BY c.id, bucket
+    """
+    params = (since, until) + ((character,) if character else ())
+    rows = conn.execute(query, params).fetchall()
+    instrumentation.count(rows_read=len(rows))
+    return rows
+
+def has_title_index(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'videos_fts'").fetchone() is not None
+
+def fts_phrase_query(names: List[str]) -> Optional[str]:
+    """FTS5 query matching any of `names` as a phrase, e.g. '"harry potter" OR "the boy who lived"'."""
+    phrases = []
+    for name in names:
+        if not name or not any(ch.isalnum() for ch in name):
+            continue
+        phrases.append('"' + name.replace('"', '""') + '"')
+    return " OR ".join(phrases) if phrases else None
+
+def _character_phrase_queries(conn: sqlite3.Connection) -> List[tuple]:
+    """(id, name, fts query) for every named character: a phrase per alias that resolves to it."""
+    names = load_alias_index(conn).names_by_character()
+    rows = conn.execute("SELECT id, name FROM characters ORDER BY id").fetchall()
+    return [(char_id, name, fts_phrase_query(names.get(char_id, []))) for char_id, name in rows if name]
+
+def _fts_mentions(conn: sqlite3.Connection, matcher: MentionMatcher, char_id: int,
+                  query: Optional[str]) -> Tuple[int, int]:
+    """(videos, total views) mentioning a character. The title index finds the candidates; the
+    matcher confirms each one, so an alias inside a longer name of someone else does not count."""
+    mention_count, total_views = 0, 0
+    if not query:
+        return mention_count, total_views
+    for title, view_count in conn.execute("""
+        SELECT v.title, vs.view_count
+        FROM videos_fts
+        JOIN videos v ON v.id = videos_fts.rowid
+        LEFT JOIN video_stats vs ON vs.video_ref = v.id
+        WHERE videos_fts MATCH ?
+    """, (query,)):
+        if char_id in matcher.scan(title):
+            mention_count += 1
+            total_views += view_count or 0
+    return mention_count, total_views
+
 def calc_character_popularity(final_db_path: str):
     """
     Counts how many YouTube videos mention each Harry Potter character in the title,
     and sums the view_count for those videos.
+    Reads the precomputed character_popularity table when character_mentions is built,
+    otherwise phrase lookups in the title index (or one streaming pass over the titles without FTS5).
     """
-    conn = sqlite3.connect(final_db_path)
+    conn = bulk_db.connect(final_db_path, pragmas=False)
+    create_final_schema(conn)
     cur = conn.cursor()
 
-    # Get all HP characters
-    cur.execute("SELECT id, name FROM characters")
-    characters = cur.fetchall()
-
     results = {}
 
-    for char_id, name in characters:
-        if not name:
-            continue
-
-        name_lower = f"%{name.lower()}%"
-
-        # Find all video IDs where the title contains this character's name
-        cur.execute("""
-            SELECT v.id
+    if mentions_up_to_date(conn):
+        for name, mention_count, total_views, _, _ in read_character_popularity(conn):
+            results[name] = {"mentions": mention_count, "views": total_views}
+        conn.close()
+        return results
+
+    # Mentions not built (or stale): one indexed phrase lookup per character
+    if has_title_index(conn):
+        matcher = load_alias_index(conn).matcher
+        for char_id, name, query in _character_phrase_queries(conn):
+            mention_count, total_views = _fts_mentions(conn, matcher, char_id, query)
+            results[name] = {"mentions": mention_count, "views": total_views}
+        conn.close()
+        return results
+
+    # no FTS5: scan every title once with the matcher instead
+    cur.execute("SELECT id, name FROM characters ORDER BY id")
+    characters = [c for c in cur.fetchall() if c[1]]
+    matcher = load_alias_index(conn).matcher
+    mentions = {char_id: 0 for char_id, _ in characters}
+    views = {char_id: 0 for char_id, _ in characters}
+    if matcher:
+        for title, view_count in conn.execute("""
+            SELECT v.title, vs.view_count
             FROM videos v
-            WHERE lower(v.title) LIKE ?
-        """, (name_lower,))
-        matching_videos = cur.fetchall()
-
-        # Count how many titles mention the character
-        mention_count = len(matching_videos)
-
-        # Sum up total views from video_stats
-        total_views = 0
-        for (vid_id,) in matching_videos:
-            cur.execute("""
-                SELECT view_count
-                FROM video_stats
-                WHERE video_ref = ?
-            """, (vid_id,))
-            stat = cur.fetchone()
-            if stat and stat[0]:
-                total_views += stat[0]
+            LEFT JOIN video_stats vs ON vs.video_ref = v.id
+        """):
+            for char_id in matcher.scan(title):
+                mentions[char_id] += 1
+                views[char_id] += view_count or 0
 
+    for char_id, name in characters:
         results[name] = {
-            "mentions": mention_count,
-            "views": total_views
+            "mentions": mentions[char_id],
+            "views": views[char_id]
         }
 
     conn.close()
@@ -322,30 +1212,29 @@ def calc_character_popularity(final_db_path: str):
 
 
 def calc_character_appearances_in_yt_videotitle(final_db_path: str):
-    conn = sqlite3.connect(final_db_path)
+    conn = bulk_db.connect(final_db_path, pragmas=False)
+    create_final_schema(conn)
     cur = conn.cursor()
 
-    cur.execute("SELECT id, name FROM characters")
-    characters = cur.fetchall()
-
-    cur.execute("SELECT id, title FROM videos")
-    videos = cur.fetchall()
-
-    conn.close()
-
     results = []
 
-    for char_id, name in characters:
-        if not name:
-            continue
-
-        name_lower = name.lower()
-        count = sum(
-            1 for _, title in videos
-            if title and name_lower in title.lower()
-        )
+    if has_title_index(conn):
+        # phrase query per character (name OR any alias) against the title index
+        matcher = load_alias_index(conn).matcher
+        for char_id, name, query in _character_phrase_queries(conn):
+            results.append((name, _fts_mentions(conn, matcher, char_id, query)[0]))
+    else:
+        cur.execute("SELECT id, name FROM characters ORDER BY id")
+        characters = [c for c in cur.fetchall() if c[1]]
+        matcher = load_alias_index(conn).matcher
+        counts = {char_id: 0 for char_id, _ in characters}
+        if matcher:
+            for (title,) in conn.execute("SELECT title FROM videos"):
+                for char_id in matcher.scan(title):
+                    counts[char_id] += 1
+        results = [(name, counts[char_id]) for char_id, name in characters]
 
-        results.append((name, count))
+    conn.close()
 
     results.sort(key=lambda x: x[1], reverse=True)
     return results
@@ -354,16 +1243,11 @@ def calc_character_appearances_in_yt_videotitle(final_db_path: str):
 # -------------------- Return Calc to TXT files --------------------
 
 def export_calculations_to_txt(db_path="combined.db", output_file="hp_stats.txt"):
-    conn = sqlite3.connect(db_path)
-    stats = calc_character_popularity(db_path)
-
-    with open(output_file, "w", encoding="utf-8") as f:
-        for name, info in stats.items():
-            f.write(f"{name}\n")
-            f.write(f"  Mentions in video titles: {info['mentions']}\n")
-            f.write(f"  Total views of those videos: {info['views']}\n\n")
+    # same file as before, written (or skipped when unchanged) by the report generator
+    import reports
+    out_dir, name = os.path.split(output_file)
+    reports.export_reports(db_path, out_dir or ".", ("txt",), names={"txt": name})
 
-    conn.close()
     print(f"TXT generated: {output_file}")
 
 
@@ -372,27 +1256,62 @@ def export_calculations_to_txt(db_path="combined.db", output_file="hp_stats.txt"
 
 # ------------------ Main script ------------------
 
-def main():
+def main(argv: Optional[List[str]] = None):
     import argparse
 
     DB_PATH = "combined.db"
 
     p = argparse.ArgumentParser("combined builder")
-    p.add_argument("--youtube-src", required=True)
+    p.add_argument("--youtube-src", required=True, nargs="+",
+                   help="one or more youtube_db shards; several are merged in parallel (newest stats win)")
     p.add_argument("--import-hp", default=None)
     p.add_argument("--limit", type=int, default=25)
-    args = p.parse_args()
-
-    if args.limit < 1 or args.limit > 25:
-        raise SystemExit("limit must be between 1 and 25")
-
-    import_youtube_from_source(args.youtube_src, DB_PATH, args.limit)
-
-    if args.import_hp:
-        import_hp_placeholder(args.import_hp, DB_PATH, args.limit)
-
-    export_calculations_to_txt(DB_PATH, "hp_stats.txt")
-    build_char_mentions(DB_PATH)
+    p.add_argument("--all", action="store_true",
+                   help="import everything not yet in combined.db (streamed in chunks, resumes if interrupted)")
+    p.add_argument("--rebuild-mentions", action="store_true",
+                   help="re-match every character against every video instead of only new ones")
+    p.add_argument("--merge-mode", choices=MERGE_MODES, default=None,
+                   help="single source only. set (default): one INSERT ... SELECT per table over an "
+                        "ATTACHed source; rows: Python batches")
+    p.add_argument("--shard-workers", type=int, default=None,
+                   help="reader processes when merging several --youtube-src shards (default: one per CPU)")
+    p.add_argument("--mention-workers", type=int, default=1,
+                   help="processes for mention matching, each scanning its own range of video ids")
+    p.add_argument("--reports-dir", default=None,
+                   help="also write every report format (csv, jsonl, parquet, ...) to this directory")
+    instrumentation.add_arguments(p)
+    args = p.parse_args(argv)
+    instrumentation.configure_from_args(args)
+
+    check_merge_options(args.youtube_src, args.all, args.merge_mode)
+    if not args.all and (args.limit < 1 or args.limit > 25):
+        raise SystemExit("limit must be between 1 and 25 (use --all to import everything)")
+    limit = None if args.all else args.limit
+
+    with instrumentation.stage("pipeline"):
+        with instrumentation.stage("import_youtube", source=args.youtube_src):
+            if len(args.youtube_src) > 1:
+                merge_youtube_shards(args.youtube_src, DB_PATH, args.shard_workers)
+            else:
+                import_youtube_from_source(args.youtube_src[0], DB_PATH, limit, mode=args.merge_mode or "set")
+
+        if args.import_hp:
+            with instrumentation.stage("import_hp", source=args.import_hp):
+                import_hp_placeholder(args.import_hp, DB_PATH, limit)
+
+        # mentions first so the export can read the precomputed table
+        with instrumentation.stage("mentions", full=args.rebuild_mentions):
+            build_char_mentions(DB_PATH, full=args.rebuild_mentions, workers=args.mention_workers)
+            if args.rebuild_mentions:
+                conn = bulk_db.connect(DB_PATH)
+                refresh_character_popularity(conn)
+                conn.close()
+        with instrumentation.stage("export"):
+            export_calculations_to_txt(DB_PATH, "hp_stats.txt")
+            if args.reports_dir:
+                import reports
+                written = reports.export_reports(DB_PATH, args.reports_dir)
+                print(f"Reports in {args.reports_dir}: {', '.join(written)}")
     print("All done! 'hp_stats.txt' has been generated.")
 
 
@@ -0,0 +1,334 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from typing import Callable, Dict, Optional
+
+# On-disk HTTP response cache shared by harrypotter_fetch and youtube_fetch.
+#
+# Entries are keyed by URL + params (the API key is left out, it does not change the answer).
+# A fresh entry (younger than its TTL) is served without touching the network. A stale entry
+# with an ETag / Last-Modified is revalidated with If-None-Match / If-Modified-Since: a 304
+# refreshes the TTL and serves the stored body. The table is capped at max_bytes and the least
+# recently used entries are evicted first.
+#
+# get_stream() is the same cache for big list endpoints: the body goes network -> temp file ->
+# BLOB (and BLOB -> temp file on a hit) in CHUNK_SIZE pieces, so it is never held in memory whole.
+
+CACHE_DB_DEFAULT = os.getenv("HTTP_CACHE_DB", "http_cache.db")
+MAX_BYTES_DEFAULT = 64 * 1024 * 1024
+TTL_DEFAULT = 3600
+SECRET_PARAMS = ("key",)
+CHUNK_SIZE = 64 * 1024
+# temp files for streamed bodies stay in memory up to this size, then move to disk
+SPOOL_MAX_MEMORY = 1024 * 1024
+
+
+class CachedResponse:
+    """Enough of requests.Response for the fetchers: status_code, headers, content, json()."""
+
+    def __init__(self, status_code: int, headers: Dict[str, str], content: bytes, from_cache: bool):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.from_cache = from_cache
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class SpooledResponse:
+    """Like CachedResponse, but the body is in a temp file and iter_content() reads it back in chunks."""
+
+    def __init__(self, status_code: int, headers: Dict[str, str], body, from_cache: bool):
+        self.status_code = status_code
+        self.headers = headers
+        self.from_cache = from_cache
+        self._body = body
+
+    def iter_content(self, chunk_size: int = CHUNK_SIZE):
+        self._body.seek(0)
+        try:
+            while True:
+                chunk = self._body.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            self.close()
+
+    @property
+    def content(self) -> bytes:
+        self._body.seek(0)
+        return self._body.read()
+
+    def json(self):
+        return json.loads(self.content)
+
+    def close(self):
+        self._body.close()
+
+
+def _spool() -> "tempfile.SpooledTemporaryFile":
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+
+
+def cache_key(url: str, params: Optional[dict] = None) -> str:
+    public = {k: v for k, v in (params or {}).items() if k not in SECRET_PARAMS}
+    raw = url + "?" + json.dumps(public, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class HttpCache:
+    def __init__(self, path: str = CACHE_DB_DEFAULT, max_bytes: int = MAX_BYTES_DEFAULT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        # the YouTube fetcher calls in from its worker threads
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS http_cache(
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                params TEXT,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL,
+                expires_at REAL,
+                last_used REAL,
+                size INTEGER
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_http_cache_last_used ON http_cache(last_used)")
+        self._conn.commit()
+
+    def get(self, url: str, params: Optional[dict], fetch: Callable[[Dict[str, str]], "object"],
+            ttl: float = TTL_DEFAULT):
+        """Return a CachedResponse for url+params. fetch(extra_headers) does the real request and
+        returns a requests.Response; it is only called on a miss or to revalidate a stale entry."""
+        key = cache_key(url, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, headers, body, etag, last_modified, expires_at FROM http_cache WHERE key = ?",
+                (key,)).fetchone()
+            if row is not None and row[5] > now:
+                self._conn.execute("UPDATE http_cache SET last_used = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self.hits += 1
+                return CachedResponse(row[0], json.loads(row[1]), row[2], True)
+
+        conditional = {}
+        if row is not None:
+            if row[3]:
+                conditional["If-None-Match"] = row[3]
+            if row[4]:
+                conditional["If-Modified-Since"] = row[4]
+        r = fetch(conditional)
+
+        with self._lock:
+            now = time.time()
+            if r.status_code == 304 and row is not None:
+                self._conn.execute("UPDATE http_cache SET expires_at = ?, last_used = ? WHERE key = ?",
+                                   (now + ttl, now, key))
+                self._conn.commit()
+                self.revalidated += 1
+                return CachedResponse(row[0], json.loads(row[1]), row[2], True)
+
+            self.misses += 1
+            body = r.content
+            headers = {k: v for k, v in r.headers.items()
+                       if k.lower() in ("content-type", "etag", "last-modified", "date")}
+            if r.status_code == 200:
+                self._conn.execute("""
+                    INSERT INTO http_cache(key, url, params, status, headers, body, etag, last_modified,
+                                           fetched_at, expires_at, last_used, size)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        status = excluded.status, headers = excluded.headers, body = excluded.body,
+                        etag = excluded.etag, last_modified = excluded.last_modified,
+                        fetched_at = excluded.fetched_at, expires_at = excluded.expires_at,
+                        last_used = excluded.last_used, size = excluded.size
+                """, (key, url, json.dumps({k: v for k, v in (params or {}).items() if k not in SECRET_PARAMS},
+                                            sort_keys=True, default=str),
+                      r.status_code, json.dumps(headers), body, r.headers.get("ETag"),
+                      r.headers.get("Last-Modified"), now, now + ttl, now, len(body)))
+                self._evict()
+                self._conn.commit()
+            return CachedResponse(r.status_code, headers, body, False)
+
+    def get_stream(self, url: str, params: Optional[dict], fetch: Callable[[Dict[str, str]], "object"],
+                   ttl: float = TTL_DEFAULT) -> SpooledResponse:
+        """get() for large bodies. fetch(extra_headers) must return a response opened with
+        stream=True; the body is spooled to a temp file and written to / read from the cache in
+        chunks. Returns a SpooledResponse to read with iter_content()."""
+        key = cache_key(url, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, headers, rowid, etag, last_modified, expires_at, size FROM http_cache WHERE key = ?",
+                (key,)).fetchone()
+            if row is not None and row[5] > now:
+                self._conn.execute("UPDATE http_cache SET last_used = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self.hits += 1
+                return SpooledResponse(row[0], json.loads(row[1]), self._read_blob(row[2]), True)
+
+        conditional = {}
+        if row is not None:
+            if row[3]:
+                conditional["If-None-Match"] = row[3]
+            if row[4]:
+                conditional["If-Modified-Since"] = row[4]
+        r = fetch(conditional)
+        try:
+            if r.status_code == 304 and row is not None:
+                body = None
+            else:
+                body = _spool()
+                for chunk in r.iter_content(CHUNK_SIZE):
+                    body.write(chunk)
+        finally:
+            r.close()
+
+        with self._lock:
+            now = time.time()
+            if body is None:
+                self._conn.execute("UPDATE http_cache SET expires_at = ?, last_used = ? WHERE key = ?",
+                                   (now + ttl, now, key))
+                self._conn.commit()
+                self.revalidated += 1
+                return SpooledResponse(row[0], json.loads(row[1]), self._read_blob(row[2]), True)
+
+            self.misses += 1
+            size = body.tell()
+            headers = {k: v for k, v in r.headers.items()
+                       if k.lower() in ("content-type", "etag", "last-modified", "date")}
+            if r.status_code == 200:
+                # reserve the BLOB at its final size, then fill it from the temp file
+                rowid = self._conn.execute("""
+                    INSERT INTO http_cache(key, url, params, status, headers, body, etag, last_modified,
+                                           fetched_at, expires_at, last_used, size)
+                    VALUES (?, ?, ?, ?, ?, zeroblob(?), ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        status = excluded.status, headers = excluded.headers, body = excluded.body,
+                        etag = excluded.etag, last_modified = excluded.last_modified,
+                        fetched_at = excluded.fetched_at, expires_at = excluded.expires_at,
+                        last_used = excluded.last_used, size = excluded.size
+                    RETURNING rowid
+                """, (key, url, json.dumps({k: v for k, v in (params or {}).items() if k not in SECRET_PARAMS},
+                                            sort_keys=True, default=str),
+                      r.status_code, json.dumps(headers), size, r.headers.get("ETag"),
+                      r.headers.get("Last-Modified"), now, now + ttl, now, size)).fetchone()[0]
+                if size:
+                    body.seek(0)
+                    with self._conn.blobopen("http_cache", "body", rowid) as blob:
+                        while True:
+                            chunk = body.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            blob.write(chunk)
+                self._evict()
+                self._conn.commit()
+            return SpooledResponse(r.status_code, headers, body, False)
+
+    def _read_blob(self, rowid: int):
+        """Copy one cached body into a temp file, CHUNK_SIZE at a time (caller holds the lock)."""
+        body = _spool()
+        with self._conn.blobopen("http_cache", "body", rowid, readonly=True) as blob:
+            while True:
+                chunk = blob.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                body.write(chunk)
+        return body
+
+    def _evict(self):
+        # keep the most recently used entries whose sizes add up to max_bytes, drop the rest
+        self._conn.execute("""
+            DELETE FROM http_cache WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY last_used DESC, key) AS running
+                    FROM http_cache
+                ) WHERE running > ?
+            )
+        """, (self.max_bytes,))
+
+    def invalidate(self, url: str, params: Optional[dict] = None):
+        with self._lock:
+            self._conn.execute("DELETE FROM http_cache WHERE key = ?", (cache_key(url, params),))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM http_cache")
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+# process-wide cache the fetch modules use; None after disable()
+_default: Optional[HttpCache] = None
+_disabled = False
+
+
+def default_cache() -> Optional[HttpCache]:
+    global _default
+    if _disabled:
+        return None
+    if _default is None:
+        _default = HttpCache()
+    return _default
+
+
+def configure(path: str = CACHE_DB_DEFAULT, max_bytes: int = MAX_BYTES_DEFAULT) -> HttpCache:
+    global _default, _disabled
+    if _default is not None:
+        _default.close()
+    _default = HttpCache(path, max_bytes)
+    _disabled = False
+    return _default
+
+
+def disable():
+    global _default, _disabled
+    if _default is not None:
+        _default.close()
+    _default = None
+    _disabled = True
+
+
+def add_arguments(p):
+    """--http-cache / --no-http-cache for the fetch CLIs."""
+    p.add_argument("--http-cache", default=CACHE_DB_DEFAULT, help="SQLite file for cached API responses")
+    p.add_argument("--http-cache-mb", type=int, default=MAX_BYTES_DEFAULT // (1024 * 1024),
+                   help="evict least recently used responses beyond this size")
+    p.add_argument("--no-http-cache", action="store_true", help="always go to the network")
+
+
+def configure_from_args(args):
+    if args.no_http_cache:
+        disable()
+    else:
+        configure(args.http_cache, args.http_cache_mb * 1024 * 1024)
+
+
+def cached_get(url: str, params: Optional[dict], fetch: Callable[[Dict[str, str]], "object"],
+               ttl: float = TTL_DEFAULT):
+    """Go through the default cache when it is on, otherwise straight to fetch({})."""
+    cache = default_cache()
+    if cache is None:
+        return fetch({})
+    return cache.get(url, params, fetch, ttl)
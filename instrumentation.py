@@ -0,0 +1,270 @@
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import threading
+import contextlib
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+# Per-stage metrics for the pipeline scripts.
+#
+#   instrumentation.configure("metrics.jsonl")          # or "metrics.db" for a stage_metrics table
+#   with instrumentation.stage("import_youtube"):
+#       ...
+#
+# While a stage is open it collects wall time, rows read/written (reported by the code through
+# count()), SQL statements (sqlite3 trace callback on every connection from bulk_db.connect) and
+# HTTP calls/bytes/latency (reported by the fetchers through record_http()). Stages nest: counts go
+# to every open stage, so an outer stage includes its inner ones. Nothing is collected until
+# configure() is called, so the hooks cost one attribute check otherwise.
+
+TOP_STATEMENTS = 10
+PROFILE_LINES = 25
+
+_lock = threading.Lock()
+_recorder = None
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _normalize_sql(sql: str) -> str:
+    # collapse whitespace and literals so the same statement with different values groups together
+    sql = re.sub(r"\s+", " ", sql).strip()
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+\b", "?", sql)
+    return sql[:200]
+
+
+class _Stage:
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+        self.started_at = _utc_now()
+        self.t0 = time.perf_counter()
+        self.rows_read = 0
+        self.rows_written = 0
+        self.sql_statements = 0
+        self.sql_nested = 0
+        self.statements: Dict[str, int] = {}
+        self.http_calls = 0
+        self.http_errors = 0
+        self.http_bytes = 0
+        self.http_seconds = 0.0
+
+    def record(self, wall: float) -> dict:
+        top = sorted(self.statements.items(), key=lambda kv: kv[1], reverse=True)[:TOP_STATEMENTS]
+        return {
+            "stage": self.name,
+            "started_at": self.started_at,
+            "wall_s": round(wall, 6),
+            "rows_read": self.rows_read,
+            "rows_written": self.rows_written,
+            "sql_statements": self.sql_statements,
+            "sql_nested": self.sql_nested,
+            "top_statements": [{"sql": sql, "count": n} for sql, n in top],
+            "http_calls": self.http_calls,
+            "http_errors": self.http_errors,
+            "http_bytes": self.http_bytes,
+            "http_seconds": round(self.http_seconds, 6),
+            "labels": self.labels,
+        }
+
+
+class Recorder:
+    """Where stage records go: a JSON-lines file ("-" for stderr), or a stage_metrics table when the path ends in .db."""
+
+    def __init__(self, sink: Optional[str], profile: bool = False, trace_memory: bool = False,
+                 profile_dir: Optional[str] = None):
+        self.sink = sink
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.run_id = f"{_utc_now()}-{os.getpid()}"
+        self.stack: List[_Stage] = []
+        self.records: List[dict] = []
+
+    def write(self, rec: dict):
+        rec = dict(rec, run_id=self.run_id)
+        self.records.append(rec)
+        if not self.sink:
+            return
+        if self.sink.endswith(".db"):
+            conn = sqlite3.connect(self.sink)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS stage_metrics(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id TEXT,
+                    stage TEXT,
+                    started_at TEXT,
+                    wall_s REAL,
+                    rows_read INTEGER,
+                    rows_written INTEGER,
+                    sql_statements INTEGER,
+                    http_calls INTEGER,
+                    http_bytes INTEGER,
+                    http_seconds REAL,
+                    detail TEXT
+                )
+            """)
+            core = ("run_id", "stage", "started_at", "wall_s", "rows_read", "rows_written",
+                    "sql_statements", "http_calls", "http_bytes", "http_seconds")
+            detail = {k: v for k, v in rec.items() if k not in core}
+            conn.execute(f"INSERT INTO stage_metrics({', '.join(core)}, detail) VALUES ({', '.join('?' for _ in core)}, ?)",
+                         [rec[k] for k in core] + [json.dumps(detail)])
+            conn.commit()
+            conn.close()
+        elif self.sink == "-":
+            sys.stderr.write(json.dumps(rec) + "\n")
+        else:
+            with open(self.sink, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec) + "\n")
+
+
+def configure(sink: Optional[str] = None, profile: bool = False, trace_memory: bool = False,
+              profile_dir: Optional[str] = None) -> Recorder:
+    """Turn collection on. sink=None keeps the records in memory only (Recorder.records)."""
+    global _recorder
+    _recorder = Recorder(sink, profile, trace_memory, profile_dir)
+    return _recorder
+
+
+def disable():
+    global _recorder
+    _recorder = None
+
+
+def enabled() -> bool:
+    return _recorder is not None
+
+
+def add_arguments(p):
+    """The --metrics/--profile/--tracemalloc flags shared by the script CLIs."""
+    p.add_argument("--metrics", default=None,
+                   help="record per-stage metrics: a .jsonl file, or a .db file (stage_metrics table)")
+    p.add_argument("--profile", action="store_true", help="cProfile every stage (top functions go in the record)")
+    p.add_argument("--profile-dir", default=None, help="with --profile: also dump <stage>.prof files here")
+    p.add_argument("--tracemalloc", action="store_true", help="record peak Python memory and top allocation sites per stage")
+
+
+def configure_from_args(args):
+    if getattr(args, "metrics", None) or getattr(args, "profile", False) or getattr(args, "tracemalloc", False):
+        # --profile/--tracemalloc alone: print the records to stderr
+        configure(args.metrics or "-", args.profile, args.tracemalloc, args.profile_dir)
+
+
+# -------------------- hooks called by the pipeline code --------------------
+
+def count(rows_read: int = 0, rows_written: int = 0):
+    rec = _recorder
+    if rec is None or not rec.stack:
+        return
+    with _lock:
+        for st in rec.stack:
+            st.rows_read += rows_read
+            st.rows_written += rows_written
+
+
+def record_http(url: str, status: Optional[int], nbytes: int, seconds: float):
+    rec = _recorder
+    if rec is None or not rec.stack:
+        return
+    with _lock:
+        for st in rec.stack:
+            st.http_calls += 1
+            st.http_bytes += nbytes
+            st.http_seconds += seconds
+            if status is None or status >= 400:
+                st.http_errors += 1
+
+
+def _on_sql(sql: str):
+    rec = _recorder
+    if rec is None or not rec.stack:
+        return
+    # statements run by triggers and virtual tables (FTS5 shadow tables) arrive prefixed with "--"
+    if sql.startswith("--"):
+        with _lock:
+            for st in rec.stack:
+                st.sql_nested += 1
+        return
+    key = _normalize_sql(sql)
+    with _lock:
+        for st in rec.stack:
+            st.sql_statements += 1
+            st.statements[key] = st.statements.get(key, 0) + 1
+
+
+def trace_connection(conn: sqlite3.Connection):
+    """Count the statements run on conn. Only installed while collection is on."""
+    if _recorder is not None:
+        conn.set_trace_callback(_on_sql)
+
+
+# -------------------- stages --------------------
+
+def _profile_summary(profiler) -> List[str]:
+    import io
+    import pstats
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    return [line for line in out.getvalue().splitlines() if line.strip()]
+
+
+@contextlib.contextmanager
+def stage(name: str, **labels) -> Iterator[Optional[_Stage]]:
+    """Time a pipeline stage and write its record when it ends (also when it raises)."""
+    rec = _recorder
+    if rec is None:
+        yield None
+        return
+    st = _Stage(name, labels)
+    profiler = None
+    tracing_memory = False
+    if rec.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+    if rec.trace_memory:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            tracing_memory = True
+        tracemalloc.reset_peak()
+    with _lock:
+        rec.stack.append(st)
+    error = None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield st
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        wall = time.perf_counter() - st.t0
+        with _lock:
+            rec.stack.remove(st)
+        out = st.record(wall)
+        if error:
+            out["error"] = error
+        if rec.trace_memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            out["py_mem_peak_bytes"] = peak
+            out["py_mem_top"] = [str(s) for s in tracemalloc.take_snapshot().statistics("lineno")[:5]]
+            if tracing_memory:
+                tracemalloc.stop()
+        if profiler is not None:
+            out["profile"] = _profile_summary(profiler)
+            if rec.profile_dir:
+                os.makedirs(rec.profile_dir, exist_ok=True)
+                path = os.path.join(rec.profile_dir, f"{name}.prof")
+                profiler.dump_stats(path)
+                out["profile_file"] = path
+        rec.write(out)
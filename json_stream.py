@@ -0,0 +1,139 @@
+import json
+import codecs
+from typing import Any, Dict, Iterable, Iterator, Optional, Union
+
+# Incremental parsing of the one big array in an API response: the HP character list
+# (a top-level array) or the "items" array of a YouTube response. Text is decoded chunk by
+# chunk and each array element is parsed on its own with JSONDecoder.raw_decode, so only one
+# element (plus one network chunk) is held at a time. Elements can be projected down to the
+# fields we store before they are handed on.
+
+CHUNK_SIZE = 64 * 1024
+_WS = " \t\r\n"
+_decoder = json.JSONDecoder()
+
+# projection spec: None keeps a value whole, a dict keeps only its keys (recursively)
+Fields = Optional[Dict[str, Any]]
+
+
+def project(value: Any, fields: Fields) -> Any:
+    if fields is None or not isinstance(value, dict):
+        return value
+    return {k: project(value[k], sub) for k, sub in fields.items() if k in value}
+
+
+class ArrayStream:
+    """Iterate the elements of the array at top-level key `key` (key=None: the document is the array).
+
+    Other top-level members (nextPageToken, etag, ...) are parsed whole into `meta`; members that
+    come after the array are only there once iteration has finished.
+    """
+
+    def __init__(self, chunks: Iterable[Union[bytes, str]], key: Optional[str] = None, fields: Fields = None):
+        self.key = key
+        self.fields = fields
+        self.meta: Dict[str, Any] = {}
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    # ---- buffer ----
+
+    def _more(self) -> bool:
+        """Append the next chunk to the buffer; False at end of input."""
+        if self._eof:
+            return False
+        # drop what has been consumed so the buffer stays about one element long
+        if self._pos:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            self._buf += self._utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+            return True
+        self._buf += self._utf8.decode(b"", final=True)
+        self._eof = True
+        return False
+
+    def _peek(self) -> str:
+        """Next non-whitespace character (not consumed); '' at end of input."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WS:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._more():
+                return ""
+
+    def _expect(self, ch: str):
+        got = self._peek()
+        if got != ch:
+            raise ValueError(f"expected {ch!r} in JSON stream, got {got!r}")
+        self._pos += 1
+
+    def _value(self) -> Any:
+        """Parse one complete JSON value at the cursor, reading more input until it fits."""
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._more():
+                    raise
+                continue
+            # a number at the very end of the buffer might continue in the next chunk
+            if end == len(self._buf) and not self._eof and self._more():
+                continue
+            self._pos = end
+            return value
+
+    # ---- structure ----
+
+    def _items(self) -> Iterator[Any]:
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield project(self._value(), self.fields)
+            sep = self._peek()
+            self._pos += 1
+            if sep == "]":
+                return
+            if sep != ",":
+                raise ValueError(f"expected ',' or ']' in JSON array, got {sep!r}")
+
+    def __iter__(self) -> Iterator[Any]:
+        if self.key is None:
+            yield from self._items()
+            return
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            name = self._value()
+            self._expect(":")
+            if name == self.key and self._peek() == "[":
+                yield from self._items()
+            else:
+                self.meta[name] = self._value()
+            sep = self._peek()
+            self._pos += 1
+            if sep == "}":
+                return
+            if sep != ",":
+                raise ValueError(f"expected ',' or '}}' in JSON object, got {sep!r}")
+
+
+def iter_response(response, key: Optional[str] = None, fields: Fields = None,
+                  chunk_size: int = CHUNK_SIZE) -> ArrayStream:
+    """ArrayStream over a requests response opened with stream=True (or anything with iter_content).
+    Responses that are already in memory (e.g. http_cache.CachedResponse) are sliced instead."""
+    if hasattr(response, "iter_content"):
+        return ArrayStream(response.iter_content(chunk_size), key, fields)
+    body = response.content
+    return ArrayStream((body[i:i + chunk_size] for i in range(0, len(body), chunk_size)), key, fields)
@@ -0,0 +1,23 @@
+import os
+import json
+from typing import Dict
+
+# {output file or chart: hash of the data it was written from}, kept next to the outputs so
+# visualization.render_all and reports.export_reports can skip work whose data has not changed
+
+
+def load_manifest(path: str) -> Dict[str, str]:
+    """The manifest at path, or {} when it is missing or unreadable (everything is rewritten)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path: str, manifest: Dict[str, str]):
+    # write a temp file and rename it, so an interrupted run never leaves half a manifest
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
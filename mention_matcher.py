@@ -0,0 +1,174 @@
+import json
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+def normalize_alias(text: Optional[str]) -> str:
+    """Case-folded, accent-free, single-spaced form used for names, aliases and titles alike,
+    so "Hermione  GRANGER" and "Hérmione Granger" both become "hermione granger"."""
+    if not text:
+        return ""
+    if not text.isascii():
+        text = "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+    return " ".join(text.casefold().split())
+
+
+def parse_alt_names(raw: Optional[str]) -> List[str]:
+    """alt_names is stored as a JSON list string (see harrypotter_fetch.gather_store_hp)."""
+    if not raw:
+        return []
+    try:
+        names = json.loads(raw)
+    except (TypeError, ValueError):
+        return []
+    if not isinstance(names, list):
+        return []
+    return [n for n in names if isinstance(n, str) and n.strip()]
+
+
+def resolve_aliases(rows: Iterable[Tuple[int, Optional[str], Optional[str]]]) -> Dict[str, Tuple[int, str, bool]]:
+    """(id, name, alt_names) character rows -> {normalized alias: (character id, alias, is primary name)}.
+    An alias several characters share goes to one of them: a primary name beats an alternate
+    name, then the lowest character id wins."""
+    best: Dict[str, Tuple[int, str, bool]] = {}
+    for char_id, name, alt_names in rows:
+        if not name:
+            continue
+        for alias, primary in [(name, True)] + [(alt, False) for alt in parse_alt_names(alt_names)]:
+            key = normalize_alias(alias)
+            if not key:
+                continue
+            held = best.get(key)
+            if held is None or (not held[2], held[0]) > (not primary, char_id):
+                best[key] = (char_id, alias.strip(), primary)
+    return best
+
+
+class AliasIndex:
+    """alias -> character lookup plus the matcher compiled from it; built once per alias table."""
+
+    def __init__(self, aliases: Dict[str, Tuple[int, str, bool]]):
+        self.aliases = aliases
+        self._matcher: Optional["MentionMatcher"] = None
+
+    def resolve(self, text: Optional[str]) -> Optional[int]:
+        hit = self.aliases.get(normalize_alias(text))
+        return hit[0] if hit else None
+
+    def patterns(self, min_id: int = 0) -> List[Tuple[int, str]]:
+        """(character id, alias) pairs for MentionMatcher, only characters with id > min_id."""
+        return sorted((char_id, key) for key, (char_id, _, _) in self.aliases.items() if char_id > min_id)
+
+    def names_by_character(self) -> Dict[int, List[str]]:
+        """character id -> the aliases that resolve to it, primary name first."""
+        out: Dict[int, List[Tuple[bool, str]]] = {}
+        for char_id, alias, primary in self.aliases.values():
+            out.setdefault(char_id, []).append((not primary, alias))
+        return {char_id: [alias for _, alias in sorted(v)] for char_id, v in out.items()}
+
+    @property
+    def matcher(self) -> "MentionMatcher":
+        if self._matcher is None:
+            self._matcher = MentionMatcher(self.patterns())
+        return self._matcher
+
+
+class MentionMatcher:
+    """Aho-Corasick automaton over every character name and alt name.
+
+    The automaton is built once, then each title is normalized (normalize_alias) and
+    scanned a single time no matter how many characters there are. A hit only counts when it sits
+    on word boundaries, so "Tom" does not match inside "Tomorrow".
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[int, str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # per state: (character id, pattern length, needs left boundary, needs right boundary)
+        self._out: List[List[Tuple[int, int, bool, bool]]] = [[]]
+        seen = set()
+        for char_id, pattern in patterns:
+            key = normalize_alias(pattern)
+            if not key or (char_id, key) in seen:
+                continue
+            seen.add((char_id, key))
+            self._add(char_id, key)
+        self._build()
+
+    def _add(self, char_id: int, key: str):
+        state = 0
+        for ch in key:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((char_id, len(key), _is_word_char(key[0]), _is_word_char(key[-1])))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                cand = self._goto[f].get(ch, 0)
+                self._fail[nxt] = cand if cand != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def __bool__(self) -> bool:
+        return len(self._goto) > 1
+
+    def scan(self, title: Optional[str]) -> Dict[int, int]:
+        """Return {character id: number of occurrences} for one title.
+
+        >>> m = MentionMatcher([(17, "Lord Voldemort"), (17, "Tom Riddle"), (17, "Voldemort"), (53, "Tom")])
+        >>> m.scan("What If Dumbledore KNEW Tom Riddle Would Become VOLDEMORT")
+        {17: 2}
+        >>> m.scan("Tom and Tom Riddle")
+        {53: 1, 17: 1}
+        """
+        counts: Dict[int, int] = {}
+        if not title:
+            return counts
+        text = normalize_alias(title)
+        n = len(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        spans: List[Tuple[int, int, int]] = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if not out[state]:
+                continue
+            for char_id, length, left, right in out[state]:
+                start = i - length + 1
+                if left and start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if right and i + 1 < n and _is_word_char(text[i + 1]):
+                    continue
+                spans.append((start, -length, char_id))
+        # leftmost-longest: a span inside a longer accepted span is part of that mention whoever it
+        # belongs to ("Tom" in "Tom Riddle"), and overlapping spans of one character count once
+        spans.sort()
+        covered = -1
+        last_end: Dict[int, int] = {}
+        for start, neg_len, char_id in spans:
+            end = start - neg_len - 1
+            if end <= covered or last_end.get(char_id, -1) >= start:
+                continue
+            covered = max(covered, end)
+            last_end[char_id] = end
+            counts[char_id] = counts.get(char_id, 0) + 1
+        return counts
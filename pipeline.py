@@ -0,0 +1,162 @@
+import sys
+from typing import List, Optional
+
+import http_cache
+import instrumentation
+
+# One entry point for the whole pipeline. Nothing is imported or done at module level:
+# each subcommand imports the module it needs inside its handler, so `mentions` or
+# `report` never load requests, matplotlib or numpy. --metrics (before the subcommand)
+# records the run as one stage plus whatever stages the called code opens.
+#
+#   python pipeline.py ingest-hp --db hp_db.db
+#   python pipeline.py ingest-yt --channel UC... --db youtube_db.db
+#   python pipeline.py merge --youtube-src youtube_db.db --import-hp hp_db.db
+#   python pipeline.py merge --youtube-src node1.db node2.db node3.db --all --workers 3
+#   python pipeline.py mentions
+#   python pipeline.py history --since 2026-01-01 --bucket week --character "Harry Potter"
+#   python pipeline.py report
+#   python pipeline.py render --out-dir charts
+
+COMBINED_DB = "combined.db"
+
+
+def cmd_ingest_hp(args, extra: List[str]):
+    from harrypotter_fetch import gather_store_hp
+    http_cache.configure_from_args(args)
+    gather_store_hp(args.db, None if args.all else args.max)
+
+
+def cmd_ingest_yt(args, extra: List[str]):
+    # youtube_fetch owns its (long) option list; hand the rest of the command line to it
+    import youtube_fetch
+    youtube_fetch.main(extra)
+
+
+def cmd_merge(args, extra: List[str]):
+    from harrypotter_youtube_db import (check_merge_options, import_youtube_from_source, import_hp_placeholder,
+                                        merge_youtube_shards)
+    check_merge_options(args.youtube_src, args.all, args.merge_mode)
+    if not args.all and (args.limit < 1 or args.limit > 25):
+        raise SystemExit("limit must be between 1 and 25 (use --all to import everything)")
+    limit = None if args.all else args.limit
+    if len(args.youtube_src) > 1:
+        merge_youtube_shards(args.youtube_src, args.db, args.workers)
+    else:
+        import_youtube_from_source(args.youtube_src[0], args.db, limit, mode=args.merge_mode or "set")
+    if args.import_hp:
+        import_hp_placeholder(args.import_hp, args.db, limit)
+
+
+def cmd_mentions(args, extra: List[str]):
+    import bulk_db
+    from harrypotter_youtube_db import build_char_mentions, refresh_character_popularity
+    build_char_mentions(args.db, full=args.rebuild, workers=args.workers)
+    if args.rebuild:
+        conn = bulk_db.connect(args.db)
+        refresh_character_popularity(conn)
+        conn.close()
+
+
+def cmd_history(args, extra: List[str]):
+    import bulk_db
+    from harrypotter_youtube_db import (HISTORY_BUCKETS, character_popularity_series, compact_stats_history,
+                                        create_final_schema)
+    conn = bulk_db.connect(args.db)
+    create_final_schema(conn)
+    if args.compact:
+        print(f"compacted video_stats_history: {compact_stats_history(conn)} rows folded")
+    if args.since:
+        until = args.until or "now"
+        for name, bucket, views, likes, comments in character_popularity_series(
+                conn, args.since, until, HISTORY_BUCKETS[args.bucket], args.character):
+            print(f"{bucket}\t{name}\t{views}\t{likes}\t{comments}")
+    conn.close()
+
+
+def cmd_report(args, extra: List[str]):
+    from reports import export_reports
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    for name, state in export_reports(args.db, args.out_dir, formats, {"txt": args.out}, args.force).items():
+        print(f"{name}: {state}")
+
+
+def cmd_render(args, extra: List[str]):
+    from visualization import render_all
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    for chart, state in render_all(args.db, args.out_dir, formats, args.workers, args.force).items():
+        print(f"{chart}: {state}")
+
+
+def build_parser():
+    import argparse
+    p = argparse.ArgumentParser("pipeline", description="Harry Potter x YouTube data pipeline")
+    instrumentation.add_arguments(p)
+    sub = p.add_subparsers(dest="command", required=True)
+
+    s = sub.add_parser("ingest-hp", help="fetch characters from the HP API into hp_db.db")
+    s.add_argument("--db", default="hp_db.db")
+    s.add_argument("--max", type=int, default=25)
+    s.add_argument("--all", action="store_true", help="store every new character")
+    http_cache.add_arguments(s)
+    s.set_defaults(func=cmd_ingest_hp)
+
+    s = sub.add_parser("ingest-yt", add_help=False,
+                       help="fetch YouTube videos (options are passed through to youtube_fetch.py)")
+    s.set_defaults(func=cmd_ingest_yt, passthrough=True)
+
+    s = sub.add_parser("merge", help="copy new rows from the source dbs into combined.db")
+    s.add_argument("--db", default=COMBINED_DB)
+    s.add_argument("--youtube-src", nargs="+", required=True)
+    s.add_argument("--import-hp", default=None)
+    s.add_argument("--limit", type=int, default=25)
+    s.add_argument("--all", action="store_true")
+    s.add_argument("--merge-mode", choices=("rows", "set"), default=None, help="single source only (default set)")
+    s.add_argument("--workers", type=int, default=None, help="reader processes for several --youtube-src shards")
+    s.set_defaults(func=cmd_merge)
+
+    s = sub.add_parser("mentions", help="update character_mentions for new videos/characters")
+    s.add_argument("--db", default=COMBINED_DB)
+    s.add_argument("--rebuild", action="store_true", help="re-match everything")
+    s.add_argument("--workers", type=int, default=1, help="processes scanning video id ranges in parallel")
+    s.set_defaults(func=cmd_mentions)
+
+    s = sub.add_parser("history", help="views/likes/comments gained per character and time bucket")
+    s.add_argument("--db", default=COMBINED_DB)
+    s.add_argument("--since", default=None, help="ISO-8601 start (inclusive)")
+    s.add_argument("--until", default=None, help="ISO-8601 end (exclusive, default now)")
+    s.add_argument("--bucket", choices=("hour", "day", "week"), default="day")
+    s.add_argument("--character", default=None)
+    s.add_argument("--compact", action="store_true", help="apply the downsampling and retention policy first")
+    s.set_defaults(func=cmd_history)
+
+    s = sub.add_parser("report", help="write hp_stats.txt and the CSV/JSONL/Parquet reports")
+    s.add_argument("--db", default=COMBINED_DB)
+    s.add_argument("--out-dir", default=".")
+    s.add_argument("--out", default="hp_stats.txt", help="file name of the TXT report")
+    s.add_argument("--formats", default="txt,appearances,csv,jsonl,parquet")
+    s.add_argument("--force", action="store_true", help="rewrite reports even if the data has not changed")
+    s.set_defaults(func=cmd_report)
+
+    s = sub.add_parser("render", help="render the charts to files (headless)")
+    s.add_argument("--db", default=COMBINED_DB)
+    s.add_argument("--out-dir", default="charts")
+    s.add_argument("--formats", default="png,svg")
+    s.add_argument("--workers", type=int, default=1)
+    s.add_argument("--force", action="store_true")
+    s.set_defaults(func=cmd_render)
+    return p
+
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    args, extra = build_parser().parse_known_args(argv)
+    if extra and not getattr(args, "passthrough", False):
+        raise SystemExit(f"unrecognized arguments: {' '.join(extra)}")
+    instrumentation.configure_from_args(args)
+    with instrumentation.stage(args.command):
+        args.func(args, extra)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import os
+import csv
+import json
+import hashlib
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import bulk_db
+import instrumentation
+from harrypotter_youtube_db import (calc_character_popularity, create_final_schema, mentions_up_to_date,
+                                    read_character_popularity)
+from manifest import load_manifest, save_manifest
+
+# Every report comes out of one read of the per-character numbers. The rows are streamed
+# once through all the requested sinks: each sink writes to <file>.tmp as the rows go by and
+# is renamed over the real file at the end, unless the manifest says the same data was already
+# written there, in which case the temp file is dropped and the report is left alone.
+#
+#   python reports.py --db combined.db --out-dir reports --formats txt,csv,jsonl,parquet
+
+COLUMNS = ("character", "mentions", "views", "likes", "comments")
+REPORT_FORMATS = ("txt", "appearances", "csv", "jsonl", "parquet")
+REPORT_MANIFEST = ".report_manifest.json"
+DEFAULT_NAMES = {
+    "txt": "hp_stats.txt",
+    "appearances": "character_appearances.txt",
+    "csv": "character_stats.csv",
+    "jsonl": "character_stats.jsonl",
+    # character_stats.columns.json when pyarrow is not installed
+    "parquet": "character_stats.parquet",
+}
+
+
+def read_report_rows(db_path: str) -> Iterator[tuple]:
+    """(character, mentions, views, likes, comments) per named character, in character id order.
+    Reads the precomputed character_popularity table; when mentions are not built yet likes and
+    comments are None and the rest comes from calc_character_popularity."""
+    conn = bulk_db.connect(db_path, pragmas=False)
+    try:
+        create_final_schema(conn)
+        if mentions_up_to_date(conn):
+            rows = read_character_popularity(conn)
+        else:
+            rows = [(name, info["mentions"], info["views"], None, None)
+                    for name, info in calc_character_popularity(db_path).items()]
+    finally:
+        conn.close()
+    instrumentation.count(rows_read=len(rows))
+    yield from rows
+
+
+# -------------------- sinks --------------------
+# Each sink has fmt, path, tmp, write(row) and close(); it writes its report to path + ".tmp"
+# and _finish() moves it into place.
+
+def _finish(sink, keep: bool):
+    """Close the sink; keep=True moves its temp file over the report, otherwise it is deleted."""
+    sink.close()
+    if keep:
+        os.replace(sink.tmp, sink.path)
+    elif os.path.exists(sink.tmp):
+        os.remove(sink.tmp)
+
+
+class _TextSink:
+    """A text report: opens path + ".tmp" for the format subclasses to write to."""
+
+    def __init__(self, path: str, newline: Optional[str] = None):
+        self.path = path
+        self.tmp = path + ".tmp"
+        self.f = open(self.tmp, "w", encoding="utf-8", newline=newline)
+
+    def close(self):
+        self.f.close()
+
+
+class TxtSink(_TextSink):
+    """hp_stats.txt"""
+
+    fmt = "txt"
+
+    def write(self, row: tuple):
+        name, mentions, views = row[0], row[1], row[2]
+        self.f.write(f"{name}\n")
+        self.f.write(f"  Mentions in video titles: {mentions}\n")
+        self.f.write(f"  Total views of those videos: {views}\n\n")
+
+
+class AppearancesSink(_TextSink):
+    """character_appearances.txt: most mentioned first, so it has to see every row before writing."""
+
+    fmt = "appearances"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.counts = []
+
+    def write(self, row: tuple):
+        self.counts.append((row[0], row[1]))
+
+    def close(self):
+        self.counts.sort(key=lambda x: x[1], reverse=True)
+        self.f.write("=== Character Appearances in YouTube Video Titles ===\n\n")
+        for name, count in self.counts:
+            self.f.write(f"{name}: {count} video title matches\n")
+        super().close()
+
+
+class CsvSink(_TextSink):
+    fmt = "csv"
+
+    def __init__(self, path: str):
+        super().__init__(path, newline="")
+        self.writer = csv.writer(self.f)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, row: tuple):
+        self.writer.writerow(row)
+
+
+class JsonlSink(_TextSink):
+    fmt = "jsonl"
+
+    def write(self, row: tuple):
+        self.f.write(json.dumps(dict(zip(COLUMNS, row))) + "\n")
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class ColumnarSink:
+    """Parquet through pyarrow when it is installed, otherwise a JSON object of column arrays."""
+
+    fmt = "parquet"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp = path + ".tmp"
+        self.columns: Dict[str, list] = {col: [] for col in COLUMNS}
+
+    def write(self, row: tuple):
+        for col, value in zip(COLUMNS, row):
+            self.columns[col].append(value)
+
+    def close(self):
+        if self.path.endswith(".parquet"):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            pq.write_table(pa.table(self.columns), self.tmp)
+        else:
+            with open(self.tmp, "w", encoding="utf-8") as f:
+                json.dump({"columns": list(COLUMNS), "data": self.columns}, f)
+
+
+SINKS = {sink.fmt: sink for sink in (TxtSink, AppearancesSink, CsvSink, JsonlSink, ColumnarSink)}
+
+
+# -------------------- export --------------------
+
+def report_names(formats: Sequence[str], names: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """format -> file name, with the columnar fallback name when pyarrow is missing."""
+    out = {}
+    for fmt in formats:
+        if fmt not in SINKS:
+            raise ValueError(f"unknown report format {fmt!r} (choose from {', '.join(REPORT_FORMATS)})")
+        name = (names or {}).get(fmt, DEFAULT_NAMES[fmt])
+        if fmt == "parquet" and name.endswith(".parquet") and not parquet_available():
+            name = name[:-len(".parquet")] + ".columns.json"
+        out[fmt] = name
+    return out
+
+
+def export_reports(db_path: str = "combined.db", out_dir: str = ".", formats: Sequence[str] = REPORT_FORMATS,
+                   names: Optional[Dict[str, str]] = None, force: bool = False) -> Dict[str, str]:
+    """Write the requested reports to out_dir from a single read of the database.
+    Returns {file name: "written" | "skipped"}; a report is skipped when the manifest shows the
+    same rows were already written to that file (and it still exists)."""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, REPORT_MANIFEST)
+    manifest = load_manifest(manifest_path)
+    files = report_names(formats, names)
+    sinks = [SINKS[fmt](os.path.join(out_dir, name)) for fmt, name in files.items()]
+
+    data = hashlib.sha256()
+    try:
+        for row in read_report_rows(db_path):
+            data.update(json.dumps(row).encode("utf-8"))
+            for sink in sinks:
+                sink.write(row)
+    except BaseException:
+        for sink in sinks:
+            _finish(sink, keep=False)
+        raise
+
+    status = {}
+    for sink in sinks:
+        name = os.path.basename(sink.path)
+        # the format is part of the key so the same file name written another way is rewritten
+        digest = hashlib.sha256(f"{sink.fmt}:{data.hexdigest()}".encode("utf-8")).hexdigest()
+        keep = force or manifest.get(name) != digest or not os.path.exists(sink.path)
+        _finish(sink, keep)
+        if keep:
+            manifest[name] = digest
+        status[name] = "written" if keep else "skipped"
+    save_manifest(manifest_path, manifest)
+    return status
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    p = argparse.ArgumentParser("reports")
+    p.add_argument("--db", default="combined.db")
+    p.add_argument("--out-dir", default=".")
+    p.add_argument("--formats", default=",".join(REPORT_FORMATS), help="comma separated, e.g. txt,csv,jsonl")
+    p.add_argument("--force", action="store_true", help="rewrite reports even if the data has not changed")
+    instrumentation.add_arguments(p)
+    args = p.parse_args(argv)
+    instrumentation.configure_from_args(args)
+
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    with instrumentation.stage("reports"):
+        for name, state in export_reports(args.db, args.out_dir, formats, force=args.force).items():
+            print(f"{name}: {state}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,36 @@
-import matplotlib.pyplot as plt
-import sqlite3
-import numpy as np
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+
+from harrypotter_youtube_db import calc_character_popularity
+from manifest import load_manifest, save_manifest
+
+# matplotlib and numpy are imported inside the functions that draw, so importing this
+# module (or running a CLI command that never renders) does not pay for them
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
 
 
 BAR_COLORS = [
     "red", "blue", "green", "purple", "orange",
     "pink", "cyan", "brown", "yellow", "gray"]
 
-def pie_harry_vs_rest(db_path="combined.db"):
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT 
-            characters.name,
-            SUM(video_stats.view_count) AS total_views
-        FROM characters
-        LEFT JOIN character_mentions
-            ON characters.id = character_mentions.character_ref
-        LEFT JOIN videos
-            ON character_mentions.video_id = videos.id
-        LEFT JOIN video_stats
-            ON videos.id = video_stats.video_ref
-        GROUP BY characters.id
-        ORDER BY total_views DESC
-    """)
-    
-    rows = cur.fetchall()
-    conn.close()
-    
+RENDER_FORMATS = ("png", "svg")
+RENDER_MANIFEST = ".render_manifest.json"
+
+# Each chart is split into a data step (plain lists, cheap to hash and to send to a worker)
+# and a draw step that only touches the Figure it is given.
+
+
+def harry_vs_rest_data(stats: Dict[str, Dict[str, int]]) -> Dict[str, list]:
+    rows = sorted(((name, info["views"]) for name, info in stats.items()),
+                  key=lambda r: r[1], reverse=True)
+
     harry_views = 0
     other_total = 0
-    
+
     for name, views in rows:
         if views is None:
             continue
@@ -39,50 +38,32 @@ def pie_harry_vs_rest(db_path="combined.db"):
             harry_views = views
         else:
             other_total += views
-    
+
     labels = ["Harry Potter", "All Other Characters"]
     values = [harry_views, other_total]
     colors = ["red", "gray"]
-    
-    plt.figure(figsize=(7,7))
-    plt.pie(values, labels=labels, autopct='%1.1f%%', colors=colors, startangle=140)
-    plt.title("Harry Potter vs. All Others (Total Views)")
-    plt.tight_layout()
-    plt.show()
+    return {"labels": labels, "values": values, "colors": colors}
 
 
+def draw_harry_vs_rest(fig: "Figure", data: Dict[str, list]):
+    ax = fig.add_subplot()
+    ax.pie(data["values"], labels=data["labels"], autopct='%1.1f%%', colors=data["colors"], startangle=140)
+    ax.set_title("Harry Potter vs. All Others (Total Views)")
+    fig.tight_layout()
+
+
+def other_characters_data(stats: Dict[str, Dict[str, int]]) -> Dict[str, list]:
+    rows = sorted(((name, info["views"]) for name, info in stats.items()
+                   if "harry potter" not in name.lower() and info["views"] >= 1),
+                  key=lambda r: r[1], reverse=True)
 
-def pie_other_characters(db_path="combined.db"):
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-
-    cur.execute("""
-        SELECT 
-            characters.name,
-            SUM(video_stats.view_count) AS total_views
-        FROM characters
-        LEFT JOIN character_mentions
-            ON characters.id = character_mentions.character_ref
-        LEFT JOIN videos
-            ON character_mentions.video_id = videos.id
-        LEFT JOIN video_stats
-            ON videos.id = video_stats.video_ref
-        WHERE characters.name NOT LIKE '%Harry Potter%'
-        GROUP BY characters.id
-        HAVING total_views >= 1
-        ORDER BY total_views DESC
-    """)
-    
-    rows = cur.fetchall()
-    conn.close()
-    
     names = []
     views = []
-    
+
     for name, v in rows:
         names.append(name)
         views.append(v)
-    
+
 
     colors = ['blue', 'green', 'purple', 'orange', 'yellow', 'pink',
               'cyan', 'brown', 'gray', 'lime']
@@ -92,42 +73,27 @@ def pie_other_characters(db_path="combined.db"):
     for _ in range(len(names)):
         slice_colors.append(colors[idx % len(colors)])
         idx += 1
+    return {"names": names, "views": views, "colors": slice_colors}
+
 
-    plt.figure(figsize=(9,9))
-    plt.pie(
-        views,
-        labels=names,
+def draw_other_characters(fig: "Figure", data: Dict[str, list]):
+    ax = fig.add_subplot()
+    ax.pie(
+        data["views"],
+        labels=data["names"],
         autopct='%1.1f%%',
-        colors=slice_colors,
+        colors=data["colors"],
         startangle=140,
-        pctdistance=0.8,     
-        labeldistance=1.1    
+        pctdistance=0.8,
+        labeldistance=1.1
     )
-    plt.title("Popularity of Other HP Characters (Total Views)")
-    plt.tight_layout()
-    plt.show()
-
+    ax.set_title("Popularity of Other HP Characters (Total Views)")
+    fig.tight_layout()
 
 
-
-
-def plot_character_title_mentions_bar(db_path="combined.db"):
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-
-    cur.execute("""
-        SELECT
-            characters.name,
-            COUNT(character_mentions.video_id) AS mention_count
-        FROM characters
-        LEFT JOIN character_mentions
-            ON characters.id = character_mentions.character_ref
-        GROUP BY characters.id
-        ORDER BY mention_count DESC
-    """)
-
-    rows = cur.fetchall()
-    conn.close()
+def title_mentions_data(stats: Dict[str, Dict[str, int]]) -> Dict[str, list]:
+    rows = sorted(((name, info["mentions"]) for name, info in stats.items()),
+                  key=lambda r: r[1], reverse=True)
 
     names = []
     mentions = []
@@ -149,12 +115,17 @@ def plot_character_title_mentions_bar(db_path="combined.db"):
         idx = idx + 1
         if idx == len(base_colors):
             idx = 0
+    return {"names": names, "mentions": mentions, "colors": colors}
 
-    plt.figure(figsize=(14, 7))
-    plt.bar(names, mentions, color=colors)
 
-    plt.ylabel("Mentions in Video Titles")
-    plt.title("Harry Potter Characters Mentioned in YouTube Titles (Distinct Colors)")
+def draw_title_mentions(fig: "Figure", data: Dict[str, list]):
+    import numpy as np
+    ax = fig.add_subplot()
+    mentions = data["mentions"]
+    ax.bar(data["names"], mentions, color=data["colors"])
+
+    ax.set_ylabel("Mentions in Video Titles")
+    ax.set_title("Harry Potter Characters Mentioned in YouTube Titles (Distinct Colors)")
 
     if len(mentions) > 0:
         max_val = max(mentions)
@@ -162,12 +133,137 @@ def plot_character_title_mentions_bar(db_path="combined.db"):
         max_val = 0
 
     step = 10
-    plt.yticks(np.arange(0, max_val + step, step))
+    ax.set_yticks(np.arange(0, max_val + step, step))
+
+    ax.tick_params(axis="x", labelrotation=75)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment("right")
+    fig.tight_layout()
+
 
-    plt.xticks(rotation=75, ha='right')
-    plt.tight_layout()
+# name -> (data step, draw step, figure size)
+CHARTS = {
+    "harry_vs_rest": (harry_vs_rest_data, draw_harry_vs_rest, (7, 7)),
+    "other_characters": (other_characters_data, draw_other_characters, (9, 9)),
+    "title_mentions_bar": (title_mentions_data, draw_title_mentions, (14, 7)),
+}
+
+
+def _show(chart: str, db_path: str):
+    import matplotlib.pyplot as plt
+    data_fn, draw_fn, size = CHARTS[chart]
+    fig = plt.figure(figsize=size)
+    draw_fn(fig, data_fn(calc_character_popularity(db_path)))
     plt.show()
 
-pie_harry_vs_rest("combined.db")
-pie_other_characters("combined.db")
-plot_character_title_mentions_bar("combined.db")
\ No newline at end of file
+
+def pie_harry_vs_rest(db_path="combined.db"):
+    _show("harry_vs_rest", db_path)
+
+
+def pie_other_characters(db_path="combined.db"):
+    _show("other_characters", db_path)
+
+
+def plot_character_title_mentions_bar(db_path="combined.db"):
+    _show("title_mentions_bar", db_path)
+
+
+def _data_hash(data: Dict[str, list]) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _render_charts(jobs: List[tuple]) -> List[str]:
+    """Draw every (chart, data, outputs) job on one Agg figure, cleared between charts and
+    saved once per format. Runs in the parent for workers=1, otherwise inside a pool worker."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    done = []
+    for chart, data, outputs in jobs:
+        _, draw_fn, size = CHARTS[chart]
+        fig.clear()
+        fig.set_size_inches(*size)
+        draw_fn(fig, data)
+        for path in outputs:
+            fig.savefig(path)
+        done.append(chart)
+    return done
+
+
+def _use_agg():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def render_all(db_path: str = "combined.db", out_dir: str = "charts",
+               formats: Sequence[str] = RENDER_FORMATS, workers: int = 1,
+               force: bool = False) -> Dict[str, str]:
+    """Render every chart to out_dir/<chart>.<format> without a display.
+
+    The popularity numbers are read once. A chart whose data hash matches the manifest
+    from the last run (and whose files still exist) is skipped. Returns {chart: "rendered" | "skipped"}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, RENDER_MANIFEST)
+    manifest = load_manifest(manifest_path)
+    stats = calc_character_popularity(db_path)
+
+    status = {}
+    jobs = []
+    hashes = {}
+    for chart, (data_fn, _, _) in CHARTS.items():
+        data = data_fn(stats)
+        # formats are part of the key so asking for a new format re-renders
+        digest = _data_hash({"data": data, "formats": list(formats)})
+        outputs = [os.path.join(out_dir, f"{chart}.{fmt}") for fmt in formats]
+        if not force and manifest.get(chart) == digest and all(os.path.exists(p) for p in outputs):
+            status[chart] = "skipped"
+            continue
+        hashes[chart] = digest
+        jobs.append((chart, data, outputs))
+
+    if jobs:
+        _use_agg()
+        if workers <= 1 or len(jobs) == 1:
+            rendered = _render_charts(jobs)
+        else:
+            # one slice of charts per worker; each worker reuses a single figure for its slice
+            n = min(workers, len(jobs))
+            slices = [jobs[i::n] for i in range(n)]
+            rendered = []
+            with ProcessPoolExecutor(max_workers=n, initializer=_use_agg) as pool:
+                for done in pool.map(_render_charts, slices):
+                    rendered.extend(done)
+        for chart in rendered:
+            manifest[chart] = hashes[chart]
+            status[chart] = "rendered"
+        save_manifest(manifest_path, manifest)
+    return status
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    p = argparse.ArgumentParser("character popularity charts")
+    p.add_argument("--db", default="combined.db")
+    p.add_argument("--render", metavar="OUT_DIR",
+                   help="render every chart to files (headless) instead of opening windows")
+    p.add_argument("--formats", default=",".join(RENDER_FORMATS), help="comma separated, e.g. png,svg")
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--force", action="store_true", help="re-render even if the data has not changed")
+    args = p.parse_args(argv)
+
+    if args.render:
+        formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+        result = render_all(args.db, args.render, formats, args.workers, args.force)
+        for chart, state in result.items():
+            print(f"{chart}: {state}")
+    else:
+        pie_harry_vs_rest(args.db)
+        pie_other_characters(args.db)
+        plot_character_title_mentions_bar(args.db)
+
+
+if __name__ == "__main__":
+    main()
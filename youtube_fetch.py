@@ -1,17 +1,241 @@
 import os
 import re
+import time
+import hashlib
+import heapq
+import random
 import sqlite3
+import itertools
+import threading
 import requests
-import argparse
-from typing import Optional, List
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, List, Iterable, Iterator
+
+import bulk_db
+import http_cache
+import instrumentation
+import json_stream
 
 API_KEY = os.getenv("YOUTUBE_API_KEY")
 DB_DEFAULT = "youtube_data.db"
 MAX_DEFAULT = 25
 
-YT_SEARCH = "https://www.googleapis.com/youtube/v3/search"
-YT_VIDEOS = "https://www.googleapis.com/youtube/v3/videos"
-YT_CHANNELS = "https://www.googleapis.com/youtube/v3/channels"
+# base URL can be pointed at a local stub server (env var or --api-base)
+YT_API_BASE = os.getenv("YOUTUBE_API_BASE", "https://www.googleapis.com/youtube/v3")
+YT_SEARCH = f"{YT_API_BASE}/search"
+YT_VIDEOS = f"{YT_API_BASE}/videos"
+YT_CHANNELS = f"{YT_API_BASE}/channels"
+YT_PLAYLIST_ITEMS = f"{YT_API_BASE}/playlistItems"
+
+CRAWL_MODES = ("search", "uploads")
+
+SEARCH_PAGE_MAX = 50   # search maxResults upper bound
+VIDEOS_BATCH_MAX = 50  # videos?id= accepts at most 50 ids
+WORKERS_DEFAULT = 8
+
+# quota units per call (https://developers.google.com/youtube/v3/determine_quota_cost)
+ENDPOINT_COST = {"search": 100, "videos": 1, "channels": 1, "playlistItems": 1}
+DAILY_QUOTA_DEFAULT = 10000
+
+# stats refresh schedule: (video younger than N days, re-poll every M days)
+REFRESH_TIERS = [(2, 1 / 24), (30, 1)]
+REFRESH_OLD_DAYS = 7  # everything older: weekly
+
+CHANNEL_CACHE_TTL = 6 * 3600  # seconds a cached channels?id= response is used without asking again
+
+# the parts of each response item we keep (see json_stream.project); everything else is dropped while parsing
+SEARCH_FIELDS = {"id": {"videoId": None}}
+PLAYLIST_FIELDS = {"contentDetails": {"videoId": None}}
+VIDEO_FIELDS = {
+    "id": None,
+    "etag": None,
+    "snippet": {"title": None, "publishedAt": None},
+    "contentDetails": {"duration": None},
+    "statistics": {"viewCount": None, "likeCount": None, "commentCount": None},
+}
+STATS_FIELDS = {"id": None, "etag": None, "statistics": {"viewCount": None, "likeCount": None, "commentCount": None}}
+
+def set_api_base(base: str):
+    global YT_API_BASE, YT_SEARCH, YT_VIDEOS, YT_CHANNELS, YT_PLAYLIST_ITEMS
+    YT_API_BASE = base.rstrip("/")
+    YT_SEARCH = f"{YT_API_BASE}/search"
+    YT_VIDEOS = f"{YT_API_BASE}/videos"
+    YT_CHANNELS = f"{YT_API_BASE}/channels"
+    YT_PLAYLIST_ITEMS = f"{YT_API_BASE}/playlistItems"
+
+def make_session(pool_size: int = WORKERS_DEFAULT) -> requests.Session:
+    """One Session shared by every worker so connections stay alive and pooled."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+class QuotaExhausted(RuntimeError):
+    pass
+
+def _quota_day() -> str:
+    # the API quota resets at midnight Pacific time
+    try:
+        from zoneinfo import ZoneInfo
+        return datetime.now(ZoneInfo("America/Los_Angeles")).date().isoformat()
+    except Exception:
+        return datetime.now(timezone.utc).date().isoformat()
+
+class QuotaScheduler:
+    """Token bucket in front of every API call.
+
+    Each call takes ENDPOINT_COST units from the bucket (refilled at `rate` units/sec, so the
+    default spreads the daily budget over 24h) and from the daily budget, which is stored in the
+    api_quota table so separate runs share it. When several threads are waiting the cheapest call
+    goes first. 429/5xx responses are retried with jittered exponential backoff.
+    """
+
+    def __init__(self, db_file: str, daily_budget: int = DAILY_QUOTA_DEFAULT, rate: Optional[float] = None,
+                 burst: Optional[float] = None, max_retries: int = 5, backoff_base: float = 1.0,
+                 backoff_cap: float = 64.0):
+        self.daily_budget = daily_budget
+        self.rate = rate if rate is not None else daily_budget / 86400.0
+        # the bucket must be able to hold the most expensive call
+        self.burst = max(burst if burst is not None else daily_budget / 10.0, max(ENDPOINT_COST.values()))
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiting: List[tuple] = []
+        self._seq = itertools.count()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("""
+          CREATE TABLE IF NOT EXISTS api_quota(
+            day TEXT PRIMARY KEY,
+            used INTEGER NOT NULL DEFAULT 0
+          )
+        """)
+        self._conn.commit()
+
+    def _used(self, day: str) -> int:
+        row = self._conn.execute("SELECT used FROM api_quota WHERE day = ?", (day,)).fetchone()
+        return row[0] if row else 0
+
+    def _charge(self, day: str, units: int):
+        self._conn.execute("""
+          INSERT INTO api_quota(day, used) VALUES(?, ?)
+          ON CONFLICT(day) DO UPDATE SET used = used + excluded.used
+        """, (day, units))
+        self._conn.commit()
+
+    def remaining(self) -> int:
+        with self._cond:
+            return max(0, self.daily_budget - self._used(_quota_day()))
+
+    def mark_exhausted(self):
+        with self._cond:
+            day = _quota_day()
+            self._charge(day, max(0, self.daily_budget - self._used(day)))
+
+    def acquire(self, endpoint: str):
+        """Block until `endpoint` can be called; raises QuotaExhausted when today's budget can't cover it."""
+        cost = ENDPOINT_COST.get(endpoint, 1)
+        ticket = (cost, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                    self._last = now
+                    timeout = None
+                    if self._waiting[0] == ticket:
+                        day = _quota_day()
+                        if self._used(day) + cost > self.daily_budget:
+                            raise QuotaExhausted(f"daily quota exhausted ({self.daily_budget} units), "
+                                                 f"cannot afford {endpoint} ({cost} units)")
+                        if self._tokens >= cost:
+                            self._tokens -= cost
+                            self._charge(day, cost)
+                            return
+                        timeout = (cost - self._tokens) / self.rate if self.rate > 0 else None
+                    self._cond.wait(timeout)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        # full jitter
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def request(self, endpoint: str, url: str, params: dict, timeout: int,
+                session: Optional[requests.Session] = None, headers: Optional[dict] = None,
+                stream: bool = False) -> requests.Response:
+        for attempt in range(self.max_retries + 1):
+            self.acquire(endpoint)
+            r = _http_get(url, params, timeout, session, headers, stream)
+            reason = _error_reason(r) if r.status_code == 403 else None
+            if reason in ("quotaExceeded", "dailyLimitExceeded"):
+                self.mark_exhausted()
+                r.close()
+                raise QuotaExhausted(f"API reported {reason}")
+            retryable = (r.status_code == 429 or r.status_code >= 500
+                         or reason in ("rateLimitExceeded", "userRateLimitExceeded"))
+            if retryable and attempt < self.max_retries:
+                # a streamed response keeps its connection until closed: give it back before sleeping
+                r.close()
+                time.sleep(self._backoff(attempt, r.headers.get("Retry-After")))
+                continue
+            _raise_for_status(r)
+            return r
+        raise RuntimeError("unreachable")
+
+    def close(self):
+        self._conn.close()
+
+def _http_get(url: str, params: dict, timeout: int, session: Optional[requests.Session] = None,
+              headers: Optional[dict] = None, stream: bool = False) -> requests.Response:
+    started = time.perf_counter()
+    try:
+        r = (session or requests).get(url, params=params, timeout=timeout, headers=headers, stream=stream)
+    except requests.RequestException:
+        instrumentation.record_http(url, None, 0, time.perf_counter() - started)
+        raise
+    # a streamed body has not been read yet: count what the server says it is sending
+    nbytes = int(r.headers.get("Content-Length") or 0) if stream else len(r.content)
+    instrumentation.record_http(url, r.status_code, nbytes, time.perf_counter() - started)
+    return r
+
+def _raise_for_status(r: requests.Response):
+    """raise_for_status(), closing the response first so a streamed error body does not hold its connection."""
+    if r.status_code >= 400:
+        r.close()
+    r.raise_for_status()
+
+def _error_reason(r: requests.Response) -> Optional[str]:
+    try:
+        errors = r.json().get("error", {}).get("errors", [])
+    except ValueError:
+        return None
+    return errors[0].get("reason") if errors else None
+
+def _api_request(url: str, params: dict, timeout: int, session: Optional[requests.Session] = None,
+                 scheduler: Optional[QuotaScheduler] = None, headers: Optional[dict] = None,
+                 stream: bool = False) -> requests.Response:
+    if scheduler is not None:
+        return scheduler.request(url.rsplit("/", 1)[-1], url, params, timeout, session, headers, stream)
+    r = _http_get(url, params, timeout, session, headers, stream)
+    _raise_for_status(r)
+    return r
+
+def _api_stream(url: str, params: dict, timeout: int, session: Optional[requests.Session] = None,
+                scheduler: Optional[QuotaScheduler] = None, fields: json_stream.Fields = None) -> json_stream.ArrayStream:
+    """The response's "items" parsed one at a time as the body arrives, projected to `fields`.
+    nextPageToken/etag end up in .meta once the items have been read."""
+    r = _api_request(url, params, timeout, session, scheduler, stream=True)
+    return json_stream.iter_response(r, "items", fields)
 
 DUR_RE = re.compile(r'P(?:([0-9]+)D)?T?(?:([0-9]+)H)?(?:([0-9]+)M)?(?:([0-9]+)S)?')
 
@@ -50,136 +274,476 @@ def init_db(conn: sqlite3.Connection):
         FOREIGN KEY(channel_ref) REFERENCES channels(id)
       )
     """)
+    # columns added after the first release: older dbs get them on open
+    _add_missing_columns(conn, "channels", {"uploads_playlist_id": "TEXT", "crawl_mode": "TEXT"})
+    _add_missing_columns(conn, "videos", {"etag": "TEXT", "stats_polled_at": "TEXT"})
+    # ETag of the last videos?id= response for a given batch of ids (see refresh_video_stats)
+    cur.execute("""
+      CREATE TABLE IF NOT EXISTS stats_batch_etags(
+        batch_key TEXT PRIMARY KEY,
+        etag TEXT
+      )
+    """)
+    _add_missing_columns(conn, "stats_batch_etags", {"updated_at": "TEXT"})
     conn.commit()
 
+def _add_missing_columns(conn: sqlite3.Connection, table: str, columns: dict):
+    have = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, decl in columns.items():
+        if name not in have:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
 def get_channel_row(conn: sqlite3.Connection, channel_id: str) -> Optional[sqlite3.Row]:
     cur = conn.cursor()
-    cur.execute("SELECT id, next_page_token FROM channels WHERE channel_id = ?", (channel_id,))
+    cur.execute("SELECT id, next_page_token, crawl_mode FROM channels WHERE channel_id = ?", (channel_id,))
     return cur.fetchone()
 
-def upsert_channel(conn: sqlite3.Connection, channel_id: str, title: str, subs: Optional[int], next_token: Optional[str]) -> int:
+def resume_token(existing: Optional[sqlite3.Row], mode: str) -> Optional[str]:
+    """Saved page token for `mode`; a token saved by the other crawl mode is useless and dropped."""
+    if not existing or not existing["next_page_token"]:
+        return None
+    if (existing["crawl_mode"] or "search") != mode:
+        return None
+    return existing["next_page_token"]
+
+def upsert_channel(conn: sqlite3.Connection, channel_id: str, title: str, subs: Optional[int], next_token: Optional[str],
+                   crawl_mode: Optional[str] = None, uploads_playlist_id: Optional[str] = None) -> int:
     cur = conn.cursor()
     cur.execute("""
-      INSERT INTO channels(channel_id, title, subscriber_count, next_page_token)
-      VALUES(?, ?, ?, ?)
+      INSERT INTO channels(channel_id, title, subscriber_count, next_page_token, crawl_mode, uploads_playlist_id)
+      VALUES(?, ?, ?, ?, ?, ?)
       ON CONFLICT(channel_id) DO UPDATE SET
         title=excluded.title,
         subscriber_count=excluded.subscriber_count,
-        next_page_token=excluded.next_page_token
-    """, (channel_id, title, subs, next_token))
+        next_page_token=excluded.next_page_token,
+        crawl_mode=COALESCE(excluded.crawl_mode, crawl_mode),
+        uploads_playlist_id=COALESCE(excluded.uploads_playlist_id, uploads_playlist_id)
+      RETURNING id
+    """, (channel_id, title, subs, next_token, crawl_mode, uploads_playlist_id))
+    row_id = cur.fetchone()[0]
     conn.commit()
-    cur.execute("SELECT id FROM channels WHERE channel_id = ?", (channel_id,))
-    return cur.fetchone()[0]
+    return row_id
 
 def save_channel_token(conn: sqlite3.Connection, channel_id: str, token: Optional[str]):
     cur = conn.cursor()
     cur.execute("UPDATE channels SET next_page_token = ? WHERE channel_id = ?", (token, channel_id))
     conn.commit()
 
-def fetch_search_ids(api_key: str, channel_id: str, max_results: int, page_token: Optional[str]) -> tuple[List[str], Optional[str]]:
+def fetch_search_ids(api_key: str, channel_id: str, max_results: int, page_token: Optional[str],
+                     session: Optional[requests.Session] = None,
+                     scheduler: Optional[QuotaScheduler] = None) -> tuple[List[str], Optional[str]]:
     params = {
         "key": api_key, "channelId": channel_id, "part": "id",
         "order": "date", "type": "video", "maxResults": max_results
     }
     if page_token:
         params["pageToken"] = page_token
-    r = requests.get(YT_SEARCH, params=params, timeout=15)
-    r.raise_for_status()
-    j = r.json()
-    ids = [it["id"]["videoId"] for it in j.get("items", []) if it.get("id", {}).get("videoId")]
-    return ids, j.get("nextPageToken")
-
-def fetch_videos(api_key: str, ids: List[str]):
-    if not ids:
-        return []
-    params = {"key": api_key, "id": ",".join(ids), "part": "snippet,contentDetails,statistics"}
-    r = requests.get(YT_VIDEOS, params=params, timeout=20)
-    r.raise_for_status()
-    return r.json().get("items", [])
+    items = _api_stream(YT_SEARCH, params, 15, session, scheduler, SEARCH_FIELDS)
+    ids = [it["id"]["videoId"] for it in items if it.get("id", {}).get("videoId")]
+    return ids, items.meta.get("nextPageToken")
 
-def fetch_channel_info(api_key: str, channel_id: str) -> Optional[dict]:
-    params = {"key": api_key, "id": channel_id, "part": "snippet,statistics"}
-    r = requests.get(YT_CHANNELS, params=params, timeout=15)
-    r.raise_for_status()
-    items = r.json().get("items", [])
+def fetch_playlist_ids(api_key: str, playlist_id: str, max_results: int, page_token: Optional[str],
+                       session: Optional[requests.Session] = None,
+                       scheduler: Optional[QuotaScheduler] = None) -> tuple[List[str], Optional[str]]:
+    """One page of a playlist (1 quota unit, up to 50 ids) — used on a channel's uploads playlist."""
+    params = {
+        "key": api_key, "playlistId": playlist_id, "part": "contentDetails",
+        "maxResults": min(max_results, SEARCH_PAGE_MAX)
+    }
+    if page_token:
+        params["pageToken"] = page_token
+    items = _api_stream(YT_PLAYLIST_ITEMS, params, 15, session, scheduler, PLAYLIST_FIELDS)
+    ids = [it["contentDetails"]["videoId"] for it in items
+           if it.get("contentDetails", {}).get("videoId")]
+    return ids, items.meta.get("nextPageToken")
+
+def iter_videos(api_key: str, ids: List[str], session: Optional[requests.Session] = None,
+                scheduler: Optional[QuotaScheduler] = None) -> Iterator[dict]:
+    """Video items (VIDEO_FIELDS only) for ids, yielded as each response is parsed."""
+    for i in range(0, len(ids), VIDEOS_BATCH_MAX):
+        batch = ids[i:i + VIDEOS_BATCH_MAX]
+        params = {"key": api_key, "id": ",".join(batch), "part": "snippet,contentDetails,statistics"}
+        yield from _api_stream(YT_VIDEOS, params, 20, session, scheduler, VIDEO_FIELDS)
+
+def fetch_videos(api_key: str, ids: List[str], session: Optional[requests.Session] = None,
+                 scheduler: Optional[QuotaScheduler] = None) -> List[dict]:
+    return list(iter_videos(api_key, ids, session, scheduler))
+
+def fetch_channel_info(api_key: str, channel_id: str, session: Optional[requests.Session] = None,
+                       scheduler: Optional[QuotaScheduler] = None) -> Optional[dict]:
+    params = {"key": api_key, "id": channel_id, "part": "snippet,statistics,contentDetails"}
+    # channel info only feeds the title/subscriber count and uploads playlist id: served from the
+    # response cache for CHANNEL_CACHE_TTL, then revalidated by ETag
+    fetch = lambda headers: _api_request(YT_CHANNELS, params, 15, session, scheduler, headers)
+    items = http_cache.cached_get(YT_CHANNELS, params, fetch, CHANNEL_CACHE_TTL).json().get("items", [])
     return items[0] if items else None
 
-def fetch_and_store(api_key: str, db_file: str, channel_id: str, max_per_run: int = 25):
+def _channel_title_subs(ch: Optional[dict]) -> tuple[str, Optional[int]]:
+    title = ch.get("snippet", {}).get("title", "") if ch else ""
+    subs_raw = ch.get("statistics", {}).get("subscriberCount") if ch else None
+    subs = int(subs_raw) if subs_raw and str(subs_raw).isdigit() else None
+    return title, subs
+
+def uploads_playlist_id(ch: Optional[dict]) -> Optional[str]:
+    if not ch:
+        return None
+    return ch.get("contentDetails", {}).get("relatedPlaylists", {}).get("uploads")
+
+def fetch_page_ids(api_key: str, channel_id: str, ch: Optional[dict], mode: str, max_results: int,
+                   page_token: Optional[str], session: Optional[requests.Session] = None,
+                   scheduler: Optional[QuotaScheduler] = None) -> tuple[List[str], Optional[str]]:
+    """One page of a channel's video ids, through search (100 units) or the uploads playlist (1 unit)."""
+    if mode == "uploads":
+        playlist = uploads_playlist_id(ch)
+        if not playlist:
+            print(f"Channel {channel_id} has no uploads playlist.")
+            return [], None
+        return fetch_playlist_ids(api_key, playlist, max_results, page_token, session, scheduler)
+    return fetch_search_ids(api_key, channel_id, max_results, page_token, session, scheduler)
+
+def _video_row(item: dict, channel_row_id: int) -> tuple:
+    snip = item.get("snippet", {})
+    cd = item.get("contentDetails", {})
+    st = item.get("statistics", {})
+
+    title = snip.get("title", "")
+    published = snip.get("publishedAt", "")
+    dur = parse_duration_iso(cd.get("duration"))
+    views = int(st.get("viewCount") or 0)
+    likes = int(st.get("likeCount") or 0)
+    comments = int(st.get("commentCount") or 0)
+    view_like_ratio = (views / likes) if likes > 0 else None
+    return (item.get("id"), channel_row_id, title, dur, views, likes, view_like_ratio, comments, published,
+            item.get("etag"), _utc_now())
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+VIDEO_COLUMNS = ("video_id", "channel_ref", "title", "duration_seconds", "view_count",
+                 "like_count", "view_like_ratio", "comment_count", "published_at",
+                 "etag", "stats_polled_at")
+
+def _insert_videos(conn: sqlite3.Connection, rows: Iterable[tuple]) -> tuple[int, int]:
+    """Insert rows (a list or a stream) in one transaction; videos we already have are skipped by ON CONFLICT."""
+    inserted = 0
+    seen = 0
+    for batch in bulk_db.chunked(rows):
+        inserted += bulk_db.insert_many(conn, "videos", VIDEO_COLUMNS, batch, conflict=("video_id",))
+        seen += len(batch)
+    conn.commit()
+    return inserted, seen - inserted
+
+def fetch_and_store(api_key: str, db_file: str, channel_id: str, max_per_run: Optional[int] = 25,
+                    scheduler: Optional[QuotaScheduler] = None, mode: str = "search"):
+    """Fetch one page (max_per_run ≤ 25) of a channel, or with max_per_run=None every remaining page,
+    storing each page and its next token before requesting the following one."""
     if not api_key:
         raise RuntimeError("Provide a YOUTUBE_API_KEY environment variable or pass --key")
-    if max_per_run < 1 or max_per_run > 25:
-        raise ValueError("max_per_run must be 1..25")
+    if max_per_run is not None and (max_per_run < 1 or max_per_run > 25):
+        raise ValueError("max_per_run must be 1..25 (or None for the whole channel)")
 
-    conn = sqlite3.connect(db_file)
+    conn = bulk_db.connect(db_file)
     conn.row_factory = sqlite3.Row
     init_db(conn)
 
     # get channel info and store/update it
-    ch = fetch_channel_info(api_key, channel_id)
-    title = ch.get("snippet", {}).get("title", "") if ch else ""
-    subs_raw = ch.get("statistics", {}).get("subscriberCount") if ch else None
-    subs = int(subs_raw) if subs_raw and str(subs_raw).isdigit() else None
+    ch = fetch_channel_info(api_key, channel_id, scheduler=scheduler)
+    title, subs = _channel_title_subs(ch)
 
     # find existing progress token if present
     existing = get_channel_row(conn, channel_id)
-    page_token = existing["next_page_token"] if existing and existing["next_page_token"] else None
+    page_token = resume_token(existing, mode)
 
     # we update channel row with the current subs and token (token updated later)
-    channel_row_id = upsert_channel(conn, channel_id, title, subs, page_token)
-
-    ids, next_token = fetch_search_ids(api_key, channel_id, max_per_run, page_token)
-    if not ids:
-        print("No video ids returned. Clearing progress token.")
-        save_channel_token(conn, channel_id, None)
-        conn.close()
-        return
+    channel_row_id = upsert_channel(conn, channel_id, title, subs, page_token, mode, uploads_playlist_id(ch))
 
-    items = fetch_videos(api_key, ids)
-    cur = conn.cursor()
+    page_size = max_per_run or SEARCH_PAGE_MAX
+    total_ids = 0
     inserted = 0
     skipped = 0
-    for item in items:
-        vid = item.get("id")
-        snip = item.get("snippet", {})
-        cd = item.get("contentDetails", {})
-        st = item.get("statistics", {})
-
-        title = snip.get("title", "")
-        published = snip.get("publishedAt", "")
-        dur = parse_duration_iso(cd.get("duration"))
-        views = int(st.get("viewCount") or 0)
-        likes = int(st.get("likeCount") or 0)
-        comments = int(st.get("commentCount") or 0)
-        view_like_ratio = (views / likes) if likes > 0 else None
-
-        try:
-            cur.execute("""INSERT INTO videos(
-                video_id, channel_ref, title, duration_seconds, view_count,
-                like_count, view_like_ratio, comment_count, published_at
-            ) VALUES(?,?,?,?,?,?,?,?,?)""",
-            (vid, channel_row_id, title, dur, views, likes, view_like_ratio, comments, published))
-            conn.commit()
-            inserted += 1
-        except sqlite3.IntegrityError:
-            skipped += 1
-            continue
+    while True:
+        ids, next_token = fetch_page_ids(api_key, channel_id, ch, mode, page_size, page_token, scheduler=scheduler)
+        if not ids:
+            if total_ids == 0:
+                print("No video ids returned. Clearing progress token.")
+                save_channel_token(conn, channel_id, None)
+                conn.close()
+                return
+            next_token = None
+            save_channel_token(conn, channel_id, None)
+            break
+
+        items = iter_videos(api_key, ids, scheduler=scheduler)
+        ins, skip = _insert_videos(conn, (_video_row(item, channel_row_id) for item in items))
+        total_ids += len(ids)
+        inserted += ins
+        skipped += skip
 
-    # save next page token for next run
-    save_channel_token(conn, channel_id, next_token)
+        # save next page token for next run (and as the resume point if a --all run is interrupted)
+        save_channel_token(conn, channel_id, next_token)
+        page_token = next_token
+        if max_per_run is not None or not next_token:
+            break
+        print(f"  ...{inserted} inserted so far")
     conn.close()
 
-    print(f"Done. API returned {len(ids)} ids. Inserted {inserted}. Skipped (duplicates) {skipped}.")
+    print(f"Done. API returned {total_ids} ids. Inserted {inserted}. Skipped (duplicates) {skipped}.")
     if next_token:
         print("Saved nextPageToken for the channel — next run will continue.")
     else:
         print("No nextPageToken returned (end reached or token expired).")
 
-if __name__ == "__main__":
+def _crawl_channel(api_key: str, channel_id: str, page_token: Optional[str], max_videos: Optional[int],
+                   session: requests.Session, scheduler: Optional[QuotaScheduler] = None,
+                   mode: str = "search") -> tuple[Optional[dict], List[str], Optional[str]]:
+    """Channel info plus up to max_videos ids (None = all), following search/uploads pages from page_token."""
+    ch = fetch_channel_info(api_key, channel_id, session, scheduler)
+    ids: List[str] = []
+    token = page_token
+    while max_videos is None or len(ids) < max_videos:
+        page_size = SEARCH_PAGE_MAX if max_videos is None else min(SEARCH_PAGE_MAX, max_videos - len(ids))
+        page_ids, token = fetch_page_ids(api_key, channel_id, ch, mode, page_size, token, session, scheduler)
+        ids.extend(page_ids)
+        if not page_ids or not token:
+            break
+    return ch, ids, token
+
+def fetch_channels(api_key: str, db_file: str, channel_ids: Iterable[str], max_per_channel: Optional[int] = SEARCH_PAGE_MAX,
+                   workers: int = WORKERS_DEFAULT, scheduler: Optional[QuotaScheduler] = None,
+                   mode: str = "search"):
+    """Multi-channel ingest: channels are crawled concurrently on a thread pool sharing one pooled
+    Session, video details are requested in 50-id batches as soon as ids come back, and all
+    SQLite writes stay on the calling thread.
+    """
+    if not api_key:
+        raise RuntimeError("Provide a YOUTUBE_API_KEY environment variable or pass --key")
+    if max_per_channel is not None and max_per_channel < 1:
+        raise ValueError("max_per_channel must be at least 1 (or None for whole channels)")
+    channel_ids = list(dict.fromkeys(channel_ids))
+
+    conn = bulk_db.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    init_db(conn)
+    start_tokens = {}
+    for cid in channel_ids:
+        existing = get_channel_row(conn, cid)
+        start_tokens[cid] = resume_token(existing, mode)
+
+    session = make_session(workers)
+    next_tokens = {}
+    failed = set()
+    inserted = 0
+    skipped = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        crawls = {
+            pool.submit(_crawl_channel, api_key, cid, start_tokens[cid], max_per_channel, session, scheduler, mode): cid
+            for cid in channel_ids
+        }
+        video_jobs = {}
+        for fut in as_completed(crawls):
+            cid = crawls[fut]
+            try:
+                ch, ids, next_token = fut.result()
+            except (requests.RequestException, QuotaExhausted) as e:
+                print(f"Channel {cid} failed: {e}")
+                failed.add(cid)
+                continue
+            title, subs = _channel_title_subs(ch)
+            channel_row_id = upsert_channel(conn, cid, title, subs, start_tokens[cid], mode, uploads_playlist_id(ch))
+            next_tokens[cid] = next_token
+            for i in range(0, len(ids), VIDEOS_BATCH_MAX):
+                batch = ids[i:i + VIDEOS_BATCH_MAX]
+                video_jobs[pool.submit(fetch_videos, api_key, batch, session, scheduler)] = (cid, channel_row_id)
+
+        for fut in as_completed(video_jobs):
+            cid, channel_row_id = video_jobs[fut]
+            try:
+                items = fut.result()
+            except (requests.RequestException, QuotaExhausted) as e:
+                print(f"Video batch for {cid} failed: {e}")
+                failed.add(cid)
+                continue
+            ins, skip = _insert_videos(conn, [_video_row(item, channel_row_id) for item in items])
+            inserted += ins
+            skipped += skip
+    session.close()
+
+    # only move a channel's progress token once every batch for it is stored
+    for cid, token in next_tokens.items():
+        if cid not in failed:
+            save_channel_token(conn, cid, token)
+    conn.close()
+
+    print(f"Done. {len(channel_ids)} channels ({len(failed)} failed). Inserted {inserted}. "
+          f"Skipped (duplicates) {skipped}.")
+
+# ------------------ stats refresh ------------------
+
+def due_for_refresh(conn: sqlite3.Connection, limit: Optional[int] = None) -> List[str]:
+    """Video ids whose stats are older than their tier allows (new uploads hourly, old ones weekly),
+    least recently polled first."""
+    tier_sql = " ".join("WHEN julianday('now') - julianday(published_at) < ? THEN ?" for _ in REFRESH_TIERS)
+    params = [v for tier in REFRESH_TIERS for v in tier] + [REFRESH_OLD_DAYS, -1 if limit is None else limit]
+    rows = conn.execute(f"""
+      SELECT video_id FROM videos
+      WHERE stats_polled_at IS NULL
+         OR julianday('now') - julianday(stats_polled_at) >= CASE {tier_sql} ELSE ? END
+      ORDER BY stats_polled_at IS NOT NULL, stats_polled_at, id
+      LIMIT ?
+    """, params).fetchall()
+    return [r[0] for r in rows]
+
+def fetch_videos_if_changed(api_key: str, ids: List[str], etag: Optional[str],
+                            session: Optional[requests.Session] = None,
+                            scheduler: Optional[QuotaScheduler] = None) -> Optional[tuple[Optional[str], List[dict]]]:
+    """Statistics for up to 50 ids; None when the server answers 304 for If-None-Match `etag`."""
+    params = {"key": api_key, "id": ",".join(ids), "part": "statistics"}
+    headers = {"If-None-Match": etag} if etag else None
+    r = _api_request(YT_VIDEOS, params, 20, session, scheduler, headers, stream=True)
+    if r.status_code == 304:
+        r.close()
+        return None
+    stream = json_stream.iter_response(r, "items", STATS_FIELDS)
+    items = list(stream)
+    return stream.meta.get("etag") or r.headers.get("ETag"), items
+
+def _stats_values(st: dict) -> tuple:
+    views = int(st.get("viewCount") or 0)
+    likes = int(st.get("likeCount") or 0)
+    comments = int(st.get("commentCount") or 0)
+    return views, likes, comments, (views / likes) if likes > 0 else None
+
+def refresh_video_stats(api_key: str, db_file: str, combined_db: Optional[str] = None, limit: Optional[int] = None,
+                        workers: int = WORKERS_DEFAULT, scheduler: Optional[QuotaScheduler] = None):
+    """Re-poll statistics for videos that are due, in 50-id batches with If-None-Match, and write
+    changed numbers to `videos` (and combined.db's video_stats when combined_db is given)."""
+    if not api_key:
+        raise RuntimeError("Provide a YOUTUBE_API_KEY environment variable or pass --key")
+    conn = bulk_db.connect(db_file)
+    init_db(conn)
+    due = due_for_refresh(conn, limit)
+    if not due:
+        print("No video stats due for refresh.")
+        conn.close()
+        return
+    item_etags = dict(conn.execute("SELECT video_id, etag FROM videos WHERE etag IS NOT NULL"))
+    batches = [due[i:i + VIDEOS_BATCH_MAX] for i in range(0, len(due), VIDEOS_BATCH_MAX)]
+    keys = [hashlib.sha1(",".join(b).encode()).hexdigest() for b in batches]
+    # batches are regrouped every run, so most keys are never asked for again: drop the ones not used
+    # within the longest re-poll interval (rows from before updated_at existed included)
+    conn.execute("""
+      DELETE FROM stats_batch_etags
+      WHERE updated_at IS NULL OR julianday('now') - julianday(updated_at) > ?
+    """, (REFRESH_OLD_DAYS,))
+    conn.commit()
+    batch_etags = dict(conn.execute("SELECT batch_key, etag FROM stats_batch_etags"))
+
+    final_conn = None
+    if combined_db:
+        # video_stats.stats_polled_at comes from the combined schema migrations
+        from harrypotter_youtube_db import VIDEO_STATS_UPSERT, create_final_schema
+        final_conn = bulk_db.connect(combined_db)
+        create_final_schema(final_conn)
+    session = make_session(workers)
+    unchanged = 0
+    updated = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        jobs = {
+            pool.submit(fetch_videos_if_changed, api_key, batch, batch_etags.get(key), session, scheduler): (batch, key)
+            for batch, key in zip(batches, keys)
+        }
+        for fut in as_completed(jobs):
+            batch, key = jobs[fut]
+            try:
+                result = fut.result()
+            except (requests.RequestException, QuotaExhausted) as e:
+                print(f"Stats batch failed: {e}")
+                continue
+            now = _utc_now()
+            changed = []
+            if result is None:
+                conn.execute("UPDATE stats_batch_etags SET updated_at = ? WHERE batch_key = ?", (now, key))
+            else:
+                etag, items = result
+                conn.execute("""
+                  INSERT INTO stats_batch_etags(batch_key, etag, updated_at) VALUES(?, ?, ?)
+                  ON CONFLICT(batch_key) DO UPDATE SET etag = excluded.etag, updated_at = excluded.updated_at
+                """, (key, etag, now))
+                for item in items:
+                    vid = item.get("id")
+                    if item.get("etag") and item_etags.get(vid) == item.get("etag"):
+                        continue
+                    changed.append((vid, item.get("etag")) + _stats_values(item.get("statistics", {})))
+            conn.executemany("""
+              UPDATE videos SET view_count = ?, like_count = ?, comment_count = ?, view_like_ratio = ?, etag = ?
+              WHERE video_id = ?
+            """, [(v, l, c, r, etag, vid) for vid, etag, v, l, c, r in changed])
+            # unchanged (304 / same item etag) and vanished videos still count as polled
+            conn.executemany("UPDATE videos SET stats_polled_at = ? WHERE video_id = ?", [(now, vid) for vid in batch])
+            conn.commit()
+            if final_conn is not None and changed:
+                final_conn.executemany(VIDEO_STATS_UPSERT, [(v, l, c, r, now, vid) for vid, _, v, l, c, r in changed])
+                final_conn.commit()
+            updated += len(changed)
+            unchanged += len(batch) - len(changed)
+    session.close()
+    if final_conn is not None:
+        final_conn.close()
+    conn.close()
+    print(f"Refreshed stats for {len(due)} videos: {updated} updated, {unchanged} unchanged.")
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
     p = argparse.ArgumentParser("simple youtube fetch")
     p.add_argument("--key", default=None, help="YouTube API key or set YOUTUBE_API_KEY")
     p.add_argument("--db", default=DB_DEFAULT, help="SQLite filename")
-    p.add_argument("--channel", required=True, help="Channel ID (starts with UC...)")
-    p.add_argument("--max", type=int, default=MAX_DEFAULT, help="Max results per run (≤25)")
-    args = p.parse_args()
+    target = p.add_mutually_exclusive_group(required=True)
+    target.add_argument("--channel", help="Channel ID (starts with UC...)")
+    target.add_argument("--channels", nargs="+", help="Several channel IDs, fetched concurrently")
+    target.add_argument("--channels-file", help="File with one channel ID per line, fetched concurrently")
+    target.add_argument("--refresh-stats", action="store_true", help="Re-poll statistics for videos that are due")
+    p.add_argument("--max", type=int, default=MAX_DEFAULT,
+                   help="Max results per run (≤25), or per channel with --channels")
+    p.add_argument("--all", action="store_true",
+                   help="Keep paging until the channel is exhausted (progress saved after every page)")
+    p.add_argument("--mode", choices=CRAWL_MODES, default="search",
+                   help="List videos with search (100 units/page) or the uploads playlist (1 unit/page)")
+    p.add_argument("--workers", type=int, default=WORKERS_DEFAULT, help="Concurrent requests for --channels")
+    p.add_argument("--api-base", default=None, help="Override the API base URL (e.g. a local stub server)")
+    p.add_argument("--combined-db", default=None, help="With --refresh-stats: also update this combined db")
+    p.add_argument("--refresh-limit", type=int, default=None, help="With --refresh-stats: max videos per run")
+    p.add_argument("--daily-budget", type=int, default=DAILY_QUOTA_DEFAULT, help="Daily API quota units")
+    p.add_argument("--rate", type=float, default=None, help="Quota units per second (default: budget spread over 24h)")
+    p.add_argument("--burst", type=float, default=None, help="Token bucket size in quota units")
+    instrumentation.add_arguments(p)
+    http_cache.add_arguments(p)
+    args = p.parse_args(argv)
+    instrumentation.configure_from_args(args)
+    http_cache.configure_from_args(args)
     key = args.key or API_KEY
-    fetch_and_store(key, args.db, args.channel, args.max)
+    if args.api_base:
+        set_api_base(args.api_base)
+    scheduler = QuotaScheduler(args.db, args.daily_budget, args.rate, args.burst)
+    max_results = None if args.all else args.max
+    try:
+        with instrumentation.stage("ingest_yt"):
+            if args.refresh_stats:
+                refresh_video_stats(key, args.db, args.combined_db, args.refresh_limit, args.workers, scheduler)
+            elif args.channel:
+                fetch_and_store(key, args.db, args.channel, max_results, scheduler, args.mode)
+            else:
+                channels = args.channels
+                if args.channels_file:
+                    with open(args.channels_file, encoding="utf-8") as f:
+                        channels = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+                fetch_channels(key, args.db, channels, max_results, args.workers, scheduler, args.mode)
+    except QuotaExhausted as e:
+        raise SystemExit(f"Stopping: {e}")
+    finally:
+        print(f"Quota remaining today: {scheduler.remaining()} units")
+        scheduler.close()
+
+
+if __name__ == "__main__":
+    main()